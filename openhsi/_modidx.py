@@ -7,7 +7,17 @@ d = { 'settings': { 'branch': 'master',
                 'lib_path': 'openhsi'},
   'syms': { 'openhsi.atmos': { 'openhsi.atmos.DataCubeViewer': ('api/atmos.html#datacubeviewer', 'openhsi/atmos.py'),
                                'openhsi.atmos.DataCubeViewer.__call__': ('api/atmos.html#datacubeviewer.__call__', 'openhsi/atmos.py'),
+                               'openhsi.atmos.DataCubeViewer.__enter__': ('api/atmos.html#datacubeviewer.__enter__', 'openhsi/atmos.py'),
+                               'openhsi.atmos.DataCubeViewer.__exit__': ('api/atmos.html#datacubeviewer.__exit__', 'openhsi/atmos.py'),
                                'openhsi.atmos.DataCubeViewer.__init__': ('api/atmos.html#datacubeviewer.__init__', 'openhsi/atmos.py'),
+                               'openhsi.atmos.DataCubeViewer._spectrum': ('api/atmos.html#datacubeviewer._spectrum', 'openhsi/atmos.py'),
+                               'openhsi.atmos.DataCubeViewer.build_pyramid': ( 'api/atmos.html#datacubeviewer.build_pyramid',
+                                                                               'openhsi/atmos.py'),
+                               'openhsi.atmos.DataCubeViewer.close': ('api/atmos.html#datacubeviewer.close', 'openhsi/atmos.py'),
+                               'openhsi.atmos.DataCubeViewer.load_pyramid': ( 'api/atmos.html#datacubeviewer.load_pyramid',
+                                                                              'openhsi/atmos.py'),
+                               'openhsi.atmos.DataCubeViewer.read': ('api/atmos.html#datacubeviewer.read', 'openhsi/atmos.py'),
+                               'openhsi.atmos.DataCubeViewer.render': ('api/atmos.html#datacubeviewer.render', 'openhsi/atmos.py'),
                                'openhsi.atmos.DataCubeViewer.setup_callbacks': ( 'api/atmos.html#datacubeviewer.setup_callbacks',
                                                                                  'openhsi/atmos.py'),
                                'openhsi.atmos.DataCubeViewer.setup_streams': ( 'api/atmos.html#datacubeviewer.setup_streams',
@@ -15,6 +25,7 @@ d = { 'settings': { 'branch': 'master',
                                'openhsi.atmos.ELC': ('api/atmos.html#elc', 'openhsi/atmos.py'),
                                'openhsi.atmos.ELC.__call__': ('api/atmos.html#elc.__call__', 'openhsi/atmos.py'),
                                'openhsi.atmos.ELC.__init__': ('api/atmos.html#elc.__init__', 'openhsi/atmos.py'),
+                               'openhsi.atmos.ELC.export_path': ('api/atmos.html#elc.export_path', 'openhsi/atmos.py'),
                                'openhsi.atmos.ELC.setup_callbacks': ('api/atmos.html#elc.setup_callbacks', 'openhsi/atmos.py'),
                                'openhsi.atmos.ELC.setup_export_6SV': ('api/atmos.html#elc.setup_export_6sv', 'openhsi/atmos.py'),
                                'openhsi.atmos.ELC.setup_export_ELC': ('api/atmos.html#elc.setup_export_elc', 'openhsi/atmos.py'),
@@ -22,41 +33,87 @@ d = { 'settings': { 'branch': 'master',
                                'openhsi.atmos.Model6SV': ('api/atmos.html#model6sv', 'openhsi/atmos.py'),
                                'openhsi.atmos.Model6SV.__call__': ('api/atmos.html#model6sv.__call__', 'openhsi/atmos.py'),
                                'openhsi.atmos.Model6SV.__init__': ('api/atmos.html#model6sv.__init__', 'openhsi/atmos.py'),
-                               'openhsi.atmos.Model6SV._sixs_run_one_wavelength': ( 'api/atmos.html#model6sv._sixs_run_one_wavelength',
-                                                                                    'openhsi/atmos.py'),
                                'openhsi.atmos.Model6SV.rad2photons': ('api/atmos.html#model6sv.rad2photons', 'openhsi/atmos.py'),
                                'openhsi.atmos.Model6SV.run_wavelengths': ('api/atmos.html#model6sv.run_wavelengths', 'openhsi/atmos.py'),
                                'openhsi.atmos.Model6SV.show': ('api/atmos.html#model6sv.show', 'openhsi/atmos.py'),
+                               'openhsi.atmos.Model6SVLUT': ('api/atmos.html#model6svlut', 'openhsi/atmos.py'),
+                               'openhsi.atmos.Model6SVLUT.__call__': ('api/atmos.html#model6svlut.__call__', 'openhsi/atmos.py'),
+                               'openhsi.atmos.Model6SVLUT.__init__': ('api/atmos.html#model6svlut.__init__', 'openhsi/atmos.py'),
+                               'openhsi.atmos.Model6SVLUT._conditions': ('api/atmos.html#model6svlut._conditions', 'openhsi/atmos.py'),
+                               'openhsi.atmos.Model6SVLUT.build': ('api/atmos.html#model6svlut.build', 'openhsi/atmos.py'),
+                               'openhsi.atmos.Model6SVLUT.interpolator': ('api/atmos.html#model6svlut.interpolator', 'openhsi/atmos.py'),
+                               'openhsi.atmos.Model6SVLUT.rad2ref': ('api/atmos.html#model6svlut.rad2ref', 'openhsi/atmos.py'),
+                               'openhsi.atmos.RadiosondeStore': ('api/atmos.html#radiosondestore', 'openhsi/atmos.py'),
+                               'openhsi.atmos.RadiosondeStore.__init__': ('api/atmos.html#radiosondestore.__init__', 'openhsi/atmos.py'),
+                               'openhsi.atmos.RadiosondeStore.fetch': ('api/atmos.html#radiosondestore.fetch', 'openhsi/atmos.py'),
+                               'openhsi.atmos.RadiosondeStore.fname': ('api/atmos.html#radiosondestore.fname', 'openhsi/atmos.py'),
+                               'openhsi.atmos.RadiosondeStore.prefetch': ('api/atmos.html#radiosondestore.prefetch', 'openhsi/atmos.py'),
+                               'openhsi.atmos.RadiosondeStore.profile': ('api/atmos.html#radiosondestore.profile', 'openhsi/atmos.py'),
+                               'openhsi.atmos.RadiosondeStore.url': ('api/atmos.html#radiosondestore.url', 'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralIndex': ('api/atmos.html#spectralindex', 'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralIndex.__init__': ('api/atmos.html#spectralindex.__init__', 'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralIndex._nearest': ('api/atmos.html#spectralindex._nearest', 'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralIndex.recall': ('api/atmos.html#spectralindex.recall', 'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralIndex.search': ('api/atmos.html#spectralindex.search', 'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralLibrary': ('api/atmos.html#spectrallibrary', 'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralLibrary.__init__': ('api/atmos.html#spectrallibrary.__init__', 'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralLibrary.dump': ('api/atmos.html#spectrallibrary.dump', 'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralLibrary.fit_splines': ( 'api/atmos.html#spectrallibrary.fit_splines',
+                                                                              'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralLibrary.import_USGS': ( 'api/atmos.html#spectrallibrary.import_usgs',
                                                                               'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralLibrary.interp': ('api/atmos.html#spectrallibrary.interp', 'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralLibrary.show': ('api/atmos.html#spectrallibrary.show', 'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralMatcher': ('api/atmos.html#spectralmatcher', 'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralMatcher.__init__': ('api/atmos.html#spectralmatcher.__init__', 'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralMatcher.build_index': ( 'api/atmos.html#spectralmatcher.build_index',
+                                                                              'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralMatcher.classify': ('api/atmos.html#spectralmatcher.classify', 'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralMatcher.drop_index': ( 'api/atmos.html#spectralmatcher.drop_index',
+                                                                             'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralMatcher.fit_ELC': ('api/atmos.html#spectralmatcher.fit_elc', 'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralMatcher.interp': ('api/atmos.html#spectralmatcher.interp', 'openhsi/atmos.py'),
+                               'openhsi.atmos.SpectralMatcher.match_labels': ( 'api/atmos.html#spectralmatcher.match_labels',
+                                                                               'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralMatcher.show': ('api/atmos.html#spectralmatcher.show', 'openhsi/atmos.py'),
                                'openhsi.atmos.SpectralMatcher.topk_spectra': ( 'api/atmos.html#spectralmatcher.topk_spectra',
                                                                                'openhsi/atmos.py'),
-                               'openhsi.atmos.remap': ('api/atmos.html#remap', 'openhsi/atmos.py')},
+                               'openhsi.atmos._load_sixs_cache': ('api/atmos.html#_load_sixs_cache', 'openhsi/atmos.py'),
+                               'openhsi.atmos._radiosonde_profile': ('api/atmos.html#_radiosonde_profile', 'openhsi/atmos.py'),
+                               'openhsi.atmos._save_sixs_cache': ('api/atmos.html#_save_sixs_cache', 'openhsi/atmos.py'),
+                               'openhsi.atmos._sixs_exe_id': ('api/atmos.html#_sixs_exe_id', 'openhsi/atmos.py'),
+                               'openhsi.atmos._sixs_input': ('api/atmos.html#_sixs_input', 'openhsi/atmos.py'),
+                               'openhsi.atmos._sixs_run_input': ('api/atmos.html#_sixs_run_input', 'openhsi/atmos.py'),
+                               'openhsi.atmos.apply_ELC': ('api/atmos.html#apply_elc', 'openhsi/atmos.py'),
+                               'openhsi.atmos.correct_nc': ('api/atmos.html#correct_nc', 'openhsi/atmos.py'),
+                               'openhsi.atmos.remap': ('api/atmos.html#remap', 'openhsi/atmos.py'),
+                               'openhsi.atmos.run_sixs_inputs': ('api/atmos.html#run_sixs_inputs', 'openhsi/atmos.py')},
             'openhsi.calibrate': { 'openhsi.calibrate.SettingsBuilderMetaclass': ( 'api/calibrate.html#settingsbuildermetaclass',
                                                                                    'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SettingsBuilderMetaclass.__new__': ( 'api/calibrate.html#settingsbuildermetaclass.__new__',
                                                                                            'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SettingsBuilderMixin': ( 'api/calibrate.html#settingsbuildermixin',
                                                                                'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SettingsBuilderMixin.avg_frames': ( 'api/calibrate.html#settingsbuildermixin.avg_frames',
+                                                                                          'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SettingsBuilderMixin.fit_HgAr_lines': ( 'api/calibrate.html#settingsbuildermixin.fit_hgar_lines',
                                                                                               'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SettingsBuilderMixin.fit_emission_lines': ( 'api/calibrate.html#settingsbuildermixin.fit_emission_lines',
                                                                                                   'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SettingsBuilderMixin.fit_emission_lines_rows': ( 'api/calibrate.html#settingsbuildermixin.fit_emission_lines_rows',
+                                                                                                       'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SettingsBuilderMixin.plot_peak_fit': ( 'api/calibrate.html#settingsbuildermixin.plot_peak_fit',
+                                                                                             'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SettingsBuilderMixin.plot_wavelength_fit': ( 'api/calibrate.html#settingsbuildermixin.plot_wavelength_fit',
+                                                                                                   'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SettingsBuilderMixin.retake_HgAr': ( 'api/calibrate.html#settingsbuildermixin.retake_hgar',
                                                                                            'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SettingsBuilderMixin.retake_emission_lines': ( 'api/calibrate.html#settingsbuildermixin.retake_emission_lines',
                                                                                                      'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SettingsBuilderMixin.retake_flat_field': ( 'api/calibrate.html#settingsbuildermixin.retake_flat_field',
                                                                                                  'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SettingsBuilderMixin.run_intsphere_cube': ( 'api/calibrate.html#settingsbuildermixin.run_intsphere_cube',
+                                                                                                  'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SettingsBuilderMixin.update_intsphere_cube': ( 'api/calibrate.html#settingsbuildermixin.update_intsphere_cube',
                                                                                                      'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SettingsBuilderMixin.update_intsphere_fit': ( 'api/calibrate.html#settingsbuildermixin.update_intsphere_fit',
@@ -83,8 +140,34 @@ d = { 'settings': { 'branch': 'master',
                                                                                           'openhsi/calibrate.py'),
                                    'openhsi.calibrate.SpectraPTController.turnOnLamp': ( 'api/calibrate.html#spectraptcontroller.turnonlamp',
                                                                                          'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator': ( 'api/calibrate.html#spectraptsimulator',
+                                                                             'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator.__enter__': ( 'api/calibrate.html#spectraptsimulator.__enter__',
+                                                                                       'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator.__exit__': ( 'api/calibrate.html#spectraptsimulator.__exit__',
+                                                                                      'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator.__init__': ( 'api/calibrate.html#spectraptsimulator.__init__',
+                                                                                      'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator.handle': ( 'api/calibrate.html#spectraptsimulator.handle',
+                                                                                    'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator.luminance': ( 'api/calibrate.html#spectraptsimulator.luminance',
+                                                                                       'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator.reply': ( 'api/calibrate.html#spectraptsimulator.reply',
+                                                                                   'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator.serve': ( 'api/calibrate.html#spectraptsimulator.serve',
+                                                                                   'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator.start': ( 'api/calibrate.html#spectraptsimulator.start',
+                                                                                   'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.SpectraPTSimulator.stop': ( 'api/calibrate.html#spectraptsimulator.stop',
+                                                                                  'openhsi/calibrate.py'),
+                                   'openhsi.calibrate._fit_rows': ('api/calibrate.html#_fit_rows', 'openhsi/calibrate.py'),
                                    'openhsi.calibrate.create_settings_builder': ( 'api/calibrate.html#create_settings_builder',
                                                                                   'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.fit_gaussians': ('api/calibrate.html#fit_gaussians', 'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.fit_peaks': ('api/calibrate.html#fit_peaks', 'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.fit_wavelength_rows': ( 'api/calibrate.html#fit_wavelength_rows',
+                                                                              'openhsi/calibrate.py'),
+                                   'openhsi.calibrate.match_lines': ('api/calibrate.html#match_lines', 'openhsi/calibrate.py'),
                                    'openhsi.calibrate.sum_gaussians': ('api/calibrate.html#sum_gaussians', 'openhsi/calibrate.py')},
             'openhsi.cameras': { 'openhsi.cameras.FlirCamera': ('api/cameras/flir.html#flircamera', 'openhsi/cameras.py'),
                                  'openhsi.cameras.FlirCameraBase': ('api/cameras/flir.html#flircamerabase', 'openhsi/cameras.py'),
@@ -230,6 +313,10 @@ d = { 'settings': { 'branch': 'master',
                               'openhsi.data.CameraProperties.fast_bin': ('api/data.html#cameraproperties.fast_bin', 'openhsi/data.py'),
                               'openhsi.data.CameraProperties.fast_smile': ('api/data.html#cameraproperties.fast_smile', 'openhsi/data.py'),
                               'openhsi.data.CameraProperties.pipeline': ('api/data.html#cameraproperties.pipeline', 'openhsi/data.py'),
+                              'openhsi.data.CameraProperties.precise_smile': ( 'api/data.html#cameraproperties.precise_smile',
+                                                                               'openhsi/data.py'),
+                              'openhsi.data.CameraProperties.precise_smile_setup': ( 'api/data.html#cameraproperties.precise_smile_setup',
+                                                                                     'openhsi/data.py'),
                               'openhsi.data.CameraProperties.rad2ref_6SV': ( 'api/data.html#cameraproperties.rad2ref_6sv',
                                                                              'openhsi/data.py'),
                               'openhsi.data.CameraProperties.set_processing_lvl': ( 'api/data.html#cameraproperties.set_processing_lvl',
@@ -243,7 +330,16 @@ d = { 'settings': { 'branch': 'master',
                               'openhsi.data.CircArrayBuffer.get': ('api/data.html#circarraybuffer.get', 'openhsi/data.py'),
                               'openhsi.data.CircArrayBuffer.is_empty': ('api/data.html#circarraybuffer.is_empty', 'openhsi/data.py'),
                               'openhsi.data.CircArrayBuffer.put': ('api/data.html#circarraybuffer.put', 'openhsi/data.py'),
+                              'openhsi.data.CircArrayBuffer.put_block': ('api/data.html#circarraybuffer.put_block', 'openhsi/data.py'),
                               'openhsi.data.CircArrayBuffer.show': ('api/data.html#circarraybuffer.show', 'openhsi/data.py'),
+                              'openhsi.data.ClockModel': ('api/data.html#clockmodel', 'openhsi/data.py'),
+                              'openhsi.data.ClockModel.__call__': ('api/data.html#clockmodel.__call__', 'openhsi/data.py'),
+                              'openhsi.data.ClockModel.__init__': ('api/data.html#clockmodel.__init__', 'openhsi/data.py'),
+                              'openhsi.data.ClockModel.__repr__': ('api/data.html#clockmodel.__repr__', 'openhsi/data.py'),
+                              'openhsi.data.ClockModel.capture_offset': ('api/data.html#clockmodel.capture_offset', 'openhsi/data.py'),
+                              'openhsi.data.ClockModel.from_pps': ('api/data.html#clockmodel.from_pps', 'openhsi/data.py'),
+                              'openhsi.data.ClockModel.from_rtc_offset': ('api/data.html#clockmodel.from_rtc_offset', 'openhsi/data.py'),
+                              'openhsi.data.ClockModel.rms_ns': ('api/data.html#clockmodel.rms_ns', 'openhsi/data.py'),
                               'openhsi.data.DataCube': ('api/data.html#datacube', 'openhsi/data.py'),
                               'openhsi.data.DataCube.__init__': ('api/data.html#datacube.__init__', 'openhsi/data.py'),
                               'openhsi.data.DataCube.__repr__': ('api/data.html#datacube.__repr__', 'openhsi/data.py'),
@@ -254,7 +350,27 @@ d = { 'settings': { 'branch': 'master',
                               'openhsi.data.DateTimeBuffer': ('api/data.html#datetimebuffer', 'openhsi/data.py'),
                               'openhsi.data.DateTimeBuffer.__getitem__': ('api/data.html#datetimebuffer.__getitem__', 'openhsi/data.py'),
                               'openhsi.data.DateTimeBuffer.__init__': ('api/data.html#datetimebuffer.__init__', 'openhsi/data.py'),
-                              'openhsi.data.DateTimeBuffer.update': ('api/data.html#datetimebuffer.update', 'openhsi/data.py')},
+                              'openhsi.data.DateTimeBuffer.data': ('api/data.html#datetimebuffer.data', 'openhsi/data.py'),
+                              'openhsi.data.DateTimeBuffer.discipline': ('api/data.html#datetimebuffer.discipline', 'openhsi/data.py'),
+                              'openhsi.data.DateTimeBuffer.update': ('api/data.html#datetimebuffer.update', 'openhsi/data.py'),
+                              'openhsi.data.LiveQuickLook': ('api/data.html#livequicklook', 'openhsi/data.py'),
+                              'openhsi.data.LiveQuickLook.__init__': ('api/data.html#livequicklook.__init__', 'openhsi/data.py'),
+                              'openhsi.data.LiveQuickLook.reset': ('api/data.html#livequicklook.reset', 'openhsi/data.py'),
+                              'openhsi.data.LiveQuickLook.restretch': ('api/data.html#livequicklook.restretch', 'openhsi/data.py'),
+                              'openhsi.data.LiveQuickLook.running_stretch': ( 'api/data.html#livequicklook.running_stretch',
+                                                                              'openhsi/data.py'),
+                              'openhsi.data.LiveQuickLook.show': ('api/data.html#livequicklook.show', 'openhsi/data.py'),
+                              'openhsi.data.LiveQuickLook.to_rgba': ('api/data.html#livequicklook.to_rgba', 'openhsi/data.py'),
+                              'openhsi.data.LiveQuickLook.update': ('api/data.html#livequicklook.update', 'openhsi/data.py'),
+                              'openhsi.data.LiveQuickLook.update_hist': ('api/data.html#livequicklook.update_hist', 'openhsi/data.py'),
+                              'openhsi.data.QuickLook': ('api/data.html#quicklook', 'openhsi/data.py'),
+                              'openhsi.data.QuickLook.__call__': ('api/data.html#quicklook.__call__', 'openhsi/data.py'),
+                              'openhsi.data.QuickLook.__init__': ('api/data.html#quicklook.__init__', 'openhsi/data.py'),
+                              'openhsi.data.QuickLook.alloc_buffers': ('api/data.html#quicklook.alloc_buffers', 'openhsi/data.py'),
+                              'openhsi.data.QuickLook.band_idxs': ('api/data.html#quicklook.band_idxs', 'openhsi/data.py'),
+                              'openhsi.data.QuickLook.render_band': ('api/data.html#quicklook.render_band', 'openhsi/data.py'),
+                              'openhsi.data.QuickLook.set_wavelengths': ('api/data.html#quicklook.set_wavelengths', 'openhsi/data.py'),
+                              'openhsi.data.QuickLook.stretch': ('api/data.html#quicklook.stretch', 'openhsi/data.py')},
             'openhsi.geometry': { 'openhsi.geometry.GeorectifyDatacube': ('api/geometry.html#georectifydatacube', 'openhsi/geometry.py'),
                                   'openhsi.geometry.GeorectifyDatacube.__init__': ( 'api/geometry.html#georectifydatacube.__init__',
                                                                                     'openhsi/geometry.py')},
@@ -275,13 +391,32 @@ d = { 'settings': { 'branch': 'master',
                                                                               'openhsi/metadata.py'),
                                   'openhsi.metadata.build_variables_widgets': ( 'api/metadata.html#build_variables_widgets',
                                                                                 'openhsi/metadata.py')},
-            'openhsi.sensors': { 'openhsi.sensors.GPIOInterface': ('api/sensors.html#gpiointerface', 'openhsi/sensors.py'),
+            'openhsi.sensors': { 'openhsi.sensors.AncillaryLog': ('api/sensors.html#ancillarylog', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.AncillaryLog.__enter__': ( 'api/sensors.html#ancillarylog.__enter__',
+                                                                             'openhsi/sensors.py'),
+                                 'openhsi.sensors.AncillaryLog.__exit__': ('api/sensors.html#ancillarylog.__exit__', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.AncillaryLog.__init__': ('api/sensors.html#ancillarylog.__init__', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.AncillaryLog.append': ('api/sensors.html#ancillarylog.append', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.AncillaryLog.close': ('api/sensors.html#ancillarylog.close', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.GPIOInterface': ('api/sensors.html#gpiointerface', 'openhsi/sensors.py'),
                                  'openhsi.sensors.GPIOInterface.__init__': ( 'api/sensors.html#gpiointerface.__init__',
                                                                              'openhsi/sensors.py'),
                                  'openhsi.sensors.GPIOInterface.status': ('api/sensors.html#gpiointerface.status', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.GPIOInterface.wait_for_edge': ( 'api/sensors.html#gpiointerface.wait_for_edge',
+                                                                                  'openhsi/sensors.py'),
                                  'openhsi.sensors.MPInterface': ('api/sensors.html#mpinterface', 'openhsi/sensors.py'),
                                  'openhsi.sensors.MPInterface.__init__': ('api/sensors.html#mpinterface.__init__', 'openhsi/sensors.py'),
                                  'openhsi.sensors.MPInterface.status': ('api/sensors.html#mpinterface.status', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.MPInterface.wait_for_edge': ( 'api/sensors.html#mpinterface.wait_for_edge',
+                                                                                'openhsi/sensors.py'),
+                                 'openhsi.sensors.PacketReader': ('api/sensors.html#packetreader', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.PacketReader.__init__': ('api/sensors.html#packetreader.__init__', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.PacketReader.__repr__': ('api/sensors.html#packetreader.__repr__', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.PacketReader._skip': ('api/sensors.html#packetreader._skip', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.PacketReader.fill': ('api/sensors.html#packetreader.fill', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.PacketReader.packets': ('api/sensors.html#packetreader.packets', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.PacketReader.read': ('api/sensors.html#packetreader.read', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.PacketReader.read_one': ('api/sensors.html#packetreader.read_one', 'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorDashboard': ('api/sensors.html#sensordashboard', 'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorDashboard.__call__': ( 'api/sensors.html#sensordashboard.__call__',
                                                                                'openhsi/sensors.py'),
@@ -290,23 +425,39 @@ d = { 'settings': { 'branch': 'master',
                                  'openhsi.sensors.SensorDashboard.clear_all': ( 'api/sensors.html#sensordashboard.clear_all',
                                                                                 'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorDashboard.close': ('api/sensors.html#sensordashboard.close', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.SensorDashboard.data_df': ( 'api/sensors.html#sensordashboard.data_df',
+                                                                              'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorDashboard.read': ('api/sensors.html#sensordashboard.read', 'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorDashboard.run': ('api/sensors.html#sensordashboard.run', 'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorDashboard.update': ( 'api/sensors.html#sensordashboard.update',
                                                                              'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorStream': ('api/sensors.html#sensorstream', 'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorStream.__init__': ('api/sensors.html#sensorstream.__init__', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.SensorStream._ingest': ('api/sensors.html#sensorstream._ingest', 'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorStream.clean_df': ('api/sensors.html#sensorstream.clean_df', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.SensorStream.flush_log': ( 'api/sensors.html#sensorstream.flush_log',
+                                                                             'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorStream.master_loop': ( 'api/sensors.html#sensorstream.master_loop',
                                                                                'openhsi/sensors.py'),
+                                 'openhsi.sensors.SensorStream.plot_df': ('api/sensors.html#sensorstream.plot_df', 'openhsi/sensors.py'),
                                  'openhsi.sensors.SensorStream.read_packet': ( 'api/sensors.html#sensorstream.read_packet',
                                                                                'openhsi/sensors.py'),
-                                 'openhsi.sensors.SensorStream.save': ('api/sensors.html#sensorstream.save', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.SensorStream.start_ingest': ( 'api/sensors.html#sensorstream.start_ingest',
+                                                                                'openhsi/sensors.py'),
+                                 'openhsi.sensors.SensorStream.stop_ingest': ( 'api/sensors.html#sensorstream.stop_ingest',
+                                                                               'openhsi/sensors.py'),
+                                 'openhsi.sensors.clean_ancillary': ('api/sensors.html#clean_ancillary', 'openhsi/sensors.py'),
                                  'openhsi.sensors.clear_pps_cb': ('api/sensors.html#clear_pps_cb', 'openhsi/sensors.py'),
                                  'openhsi.sensors.collect_sim': ('api/sensors.html#collect_sim', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.decode_dashboard_lines': ( 'api/sensors.html#decode_dashboard_lines',
+                                                                             'openhsi/sensors.py'),
                                  'openhsi.sensors.decode_packet': ('api/sensors.html#decode_packet', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.decode_packets': ('api/sensors.html#decode_packets', 'openhsi/sensors.py'),
                                  'openhsi.sensors.interp2camera_times': ('api/sensors.html#interp2camera_times', 'openhsi/sensors.py'),
-                                 'openhsi.sensors.set_pps_cb': ('api/sensors.html#set_pps_cb', 'openhsi/sensors.py')},
+                                 'openhsi.sensors.load_ancillary_log': ('api/sensors.html#load_ancillary_log', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.rtc_offset_ms': ('api/sensors.html#rtc_offset_ms', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.set_pps_cb': ('api/sensors.html#set_pps_cb', 'openhsi/sensors.py'),
+                                 'openhsi.sensors.slerp': ('api/sensors.html#slerp', 'openhsi/sensors.py')},
             'openhsi.shared': { 'openhsi.shared.SharedCircArrayBuffer': ('api/shared.html#sharedcircarraybuffer', 'openhsi/shared.py'),
                                 'openhsi.shared.SharedCircArrayBuffer.__init__': ( 'api/shared.html#sharedcircarraybuffer.__init__',
                                                                                    'openhsi/shared.py'),
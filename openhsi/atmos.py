@@ -1,7 +1,8 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/api/atmos.ipynb.
 
 # %% auto 0
-__all__ = ['Model6SV', 'remap', 'SpectralLibrary', 'SpectralMatcher', 'ELC', 'DataCubeViewer']
+__all__ = ['RadiosondeStore', 'Model6SV', 'run_sixs_inputs', 'Model6SVLUT', 'remap', 'SpectralLibrary', 'SpectralIndex',
+           'SpectralMatcher', 'ELC', 'apply_ELC', 'correct_nc', 'DataCubeViewer']
 
 # %% ../nbs/api/atmos.ipynb 5
 from fastcore.foundation import patch
@@ -17,6 +18,19 @@ from tqdm import tqdm
 import warnings
 from pathlib import Path
 import pickle
+import hashlib
+import subprocess
+import shutil
+import re
+import io
+from urllib.request import urlopen
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+from functools import lru_cache
+from numpy.linalg import norm
+import xarray as xr
+import netCDF4
+from scipy.interpolate import RegularGridInterpolator, make_interp_spline
 
 from typing import Iterable, Union, Callable, List, TypeVar, Generic, Tuple, Optional
 
@@ -29,10 +43,91 @@ import holoviews as hv
 hv.extension('bokeh',logo=False)
 
 from Py6S import *
+from Py6S.sixs import SIXSVERSION
 
 # %% ../nbs/api/atmos.ipynb 6
 from .data import *
 
+# %% ../nbs/api/atmos.ipynb 7
+def _radiosonde_profile(pressure:np.ndarray,     # hPa
+                        altitude:np.ndarray,     # km
+                        temperature:np.ndarray,  # deg C
+                        mixing_ratio:np.ndarray, # g/kg
+                        base_profile:int,        # `AtmosProfile` used above the sounding
+                       ) -> str: # value for `SixS.atmos_profile`
+    """Interpolate a sounding to the 6SV levels like `SixSHelpers.Radiosonde._import_from_arrays` in Py6S 1.9,
+    kept here so Py6S upgrades cannot change the private helper under us. Levels are sorted by altitude and repeated 
+    altitudes keep their first reading since `np.interp` needs increasing altitudes."""
+    ok = np.isfinite(altitude)
+    altitude, first = np.unique(np.asarray(altitude)[ok], return_index=True) # sorted
+    pressure, temperature, mixing_ratio = (np.asarray(x)[ok][first] for x in (pressure, temperature, mixing_ratio))
+    R = SixSHelpers.Radiosonde
+    levels = R.sixs_altitudes
+    below  = levels < np.max(altitude)
+    pres  = np.interp(levels[below], altitude, pressure, left=pressure[0], right=pressure[0])
+    temp  = np.interp(levels[below], altitude, temperature, left=temperature[0], right=temperature[0]) + 273.15 # K
+    mixr  = np.interp(levels[below], altitude, mixing_ratio, left=mixing_ratio[0], right=mixing_ratio[0])
+    water = mixr*0.3484*(pres/temp)*(1 - 0.000379*mixr) # g/m^3
+    
+    i = base_profile - 1 # the rest of the profile comes from the base profile
+    return AtmosProfile.RadiosondeProfile({"altitude":levels,
+                                           "pressure":np.hstack((pres, R.pressure_profiles[i][~below])),
+                                           "temperature":np.hstack((temp, R.temp_profiles[i][~below])),
+                                           "water":np.hstack((water, R.water_density_profiles[i][~below])),
+                                           "ozone":R.ozone_density_profiles[i]})
+
+class RadiosondeStore():
+    """Local store of University of Wyoming radiosonde soundings keyed by station, region and date-hour.
+    Pages are downloaded once and parsed profiles are kept in memory, so `Model6SV` can be created offline."""
+    def __init__(self, 
+                 cache_dir:str = str(Path.home()/".cache"/"openhsi"/"radiosonde"), # directory of saved sounding pages
+                 offline:bool = False, # raise an error instead of downloading missing soundings
+                ):
+        self.cache_dir = cache_dir
+        self.offline   = offline
+        self.profiles  = {} # parsed profiles keyed by page and base profile
+        
+    def url(self, station_num:int, region:str, z_time:datetime, z_hour:int) -> str:
+        return f"http://weather.uwyo.edu/cgi-bin/sounding?region={region}&TYPE=TEXT%3ALIST&YEAR={z_time.year}&MONTH={z_time.month:02d}&FROM={z_time.day:02d}{z_hour:02d}{z_time.minute:02d}&TO={z_time.day:02d}{z_hour:02d}&STNM={station_num}"
+    
+    def fname(self, station_num:int, region:str, z_time:datetime, z_hour:int) -> str:
+        return f"{self.cache_dir}/{region}_{station_num}_{z_time.year}{z_time.month:02d}{z_time.day:02d}{z_hour:02d}.html"
+    
+    def fetch(self, station_num:int, region:str, z_time:datetime, z_hour:int) -> str: # path to saved page
+        """Download the sounding page if it is not already saved."""
+        fname = self.fname(station_num, region, z_time, z_hour)
+        if os.path.exists(fname): return fname
+        if self.offline: raise FileNotFoundError(f"No saved radiosonde sounding {fname} and the store is offline.")
+        
+        with urlopen(self.url(station_num, region, z_time, z_hour)) as u: html = u.read().decode()
+        if re.search("<PRE>", html, re.IGNORECASE) is None:
+            raise ValueError(f"No radiosonde sounding for station {station_num} at {z_time.date()} {z_hour:02d}Z.")
+        Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+        with open(fname+".tmp","w") as f: f.write(html)
+        os.replace(fname+".tmp",fname)
+        return fname
+    
+    def prefetch(self, station_num:int, region:str, z_times:List[datetime], z_hours:List[int]):
+        """Save the soundings for all the `z_times` so they can be used offline."""
+        for z_time, z_hour in zip(z_times, z_hours): self.fetch(station_num, region, z_time, z_hour)
+    
+    def profile(self, station_num:int, region:str, z_time:datetime, z_hour:int, 
+                base_profile:int = AtmosProfile.MidlatitudeSummer, # profile used above the sounding
+               ) -> AtmosProfile: # value for `SixS.atmos_profile`
+        """Parse a sounding in the same way as `SixSHelpers.Radiosonde.import_uow_radiosonde_data`."""
+        fname = self.fetch(station_num, region, z_time, z_hour)
+        if (fname, base_profile) in self.profiles: return self.profiles[(fname, base_profile)]
+        
+        with open(fname) as f: html = f.read()
+        table = re.search("<PRE>(.*?)</PRE>", html, re.IGNORECASE | re.DOTALL).groups()[0].strip()
+        table = "\n".join(table.split("\n")[:-1]) # last line is normally incomplete
+        num_skip = 5 if len(table.split("\n")[4].split()) != 11 else 4 # partly empty first line
+        array = np.genfromtxt(io.BytesIO(table.encode()), skip_header=num_skip, delimiter=7, usecols=(0, 1, 2, 5), filling_values=0)
+        
+        profile = _radiosonde_profile(array[:,0], array[:,1]/1000, array[:,2], array[:,3], base_profile)
+        self.profiles[(fname, base_profile)] = profile
+        return profile
+
 # %% ../nbs/api/atmos.ipynb 8
 class Model6SV(object):
     """Create a 6SV model using Py6S."""
@@ -49,10 +144,14 @@ class Model6SV(object):
                  aero_profile:AeroProfile = AeroProfile.Maritime, # 6SV aerosol profile
                  wavelength_array:np.array = None, # wavelengths array in nm
                  sixs_path:str=None, # path to 6SV executable
+                 cache_path:str=str(Path.home()/".cache"/"openhsi"/"6sv_cache.pkl"), # 6SV result cache file. `None` to disable
+                 radiosonde_store:RadiosondeStore=None, # where radiosonde soundings are saved. Defaults to `RadiosondeStore()`
                 ):
         """Calculates the at sensor radiance using 6SV for location at latitude `lat` and longitude `lon` at time `z_time` and altitude `alt`. 
         The `station_num` and `region` refers to the radiosonde data. You can also specify the viewing zenith `zen` and azimuth `azi`.
-        The radiance is calculated for wavelengths in `wavelength_array`. The 6SV executable path can be specified in `sixs_path`."""
+        The radiance is calculated for wavelengths in `wavelength_array`. The 6SV executable path can be specified in `sixs_path`.
+        Results are cached in `cache_path` so only new 6SV inputs are run."""
+        self.cache_path = cache_path
         
         if wavelength_array is None: wavelength_array = np.arange(400,800,4)
         self.wavelength_array = wavelength_array/1e3 # convert to μm for Py6S 
@@ -63,8 +162,8 @@ class Model6SV(object):
         
         # crude calculation if daytime is 12Z or 0Z based on time and longitude
         z_hour = 0 if ((z_time.hour + int(lon/30))%24 - 12)/12. < 0.5 else 12
-        radiosonde_url = f"http://weather.uwyo.edu/cgi-bin/sounding?region={region}&TYPE=TEXT%3ALIST&YEAR={z_time.year}&MONTH={z_time.month:02d}&FROM={z_time.day:02d}{z_hour:02d}{z_time.minute:02d}&TO={z_time.day:02d}{z_hour:02d}&STNM={station_num}"
-        s.atmos_profile = SixSHelpers.Radiosonde.import_uow_radiosonde_data(radiosonde_url,AtmosProfile.MidlatitudeSummer)
+        if radiosonde_store is None: radiosonde_store = RadiosondeStore()
+        s.atmos_profile = radiosonde_store.profile(station_num,region,z_time,z_hour,AtmosProfile.MidlatitudeSummer)
 
         # Aerosol
         s.aero_profile = AeroProfile.PredefinedType(aero_profile)
@@ -108,30 +207,183 @@ class Model6SV(object):
             xlabel="wavelength (nm)", ylabel="radiance (μW/cm$^2$/sr/nm)")
 
 # %% ../nbs/api/atmos.ipynb 12
-@patch
-def _sixs_run_one_wavelength(self:Model6SV, wv:float) -> float:
-    """Runs one instance of 6SV for one wavelength wv"""
-    self.s.outputs = None
-    a = copy.deepcopy(self.s)
-    a.wavelength = Wavelength(wv)
-    a.run()
-    return SixSHelpers.Wavelengths.recursive_getattr(a.outputs, "pixel_radiance")
+def _sixs_input(s:SixS, wv:float) -> str:
+    """6SV input file contents for `s` at wavelength `wv` (in μm)"""
+    s.wavelength = Wavelength(wv)
+    fname = s.write_input_file()
+    with open(fname) as f: input_file = f.read()
+    os.remove(fname)
+    return input_file
+
+def _sixs_run_input(sixs_path:str, input_file:str) -> float:
+    """Run the 6SV executable on `input_file` contents and return the pixel radiance. Runs in a worker process."""
+    process = subprocess.run([sixs_path], input=input_file.encode(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise ExecutionError(f"6SV exited with code {process.returncode}: {process.stderr.decode(errors='replace').strip()}")
+    try:
+        outputs = Outputs(process.stdout, process.stderr)
+        radiance = outputs.pixel_radiance
+    except Exception as e: raise ExecutionError(f"Could not parse the 6SV output: {e}") from e
+    if outputs.version != SIXSVERSION: raise ExecutionError("Running unsupported 6SV version. Py6S requires 6SV1.1")
+    return radiance
+
+def _sixs_exe_id(sixs_path:str) -> str:
+    """Identify the 6SV executable by its resolved path, size and modification time so rebuilds do not reuse cached results."""
+    if sixs_path is None: raise ExecutionError("6S executable not found.")
+    exe = shutil.which(sixs_path) or sixs_path
+    if not os.path.isfile(exe): raise ExecutionError("6S executable not found.")
+    st = os.stat(exe)
+    return f"{os.path.realpath(exe)}:{st.st_size}:{st.st_mtime_ns}"
+
+def _load_sixs_cache(cache_path:str) -> dict:
+    """Load the 6SV result cache, keyed by a hash of the 6SV input file."""
+    if cache_path is None or not os.path.exists(cache_path): return {}
+    with open(cache_path,"rb") as f: return pickle.load(f)
+
+def _save_sixs_cache(cache_path:str, results:dict):
+    """Add `results` to the 6SV result cache on disk."""
+    if cache_path is None or len(results) == 0: return
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    cache = _load_sixs_cache(cache_path) # in case another process added to it
+    cache.update(results)
+    with open(cache_path+".tmp","wb") as f: pickle.dump(cache,f,protocol=4)
+    os.replace(cache_path+".tmp",cache_path)
+
+def run_sixs_inputs(sixs_path:str,       # path to 6SV executable
+                    inputs:List[str],    # 6SV input file contents
+                    cache_path:str=None, # 6SV result cache file. `None` to disable
+                    n_processes:int=None, # number of worker processes. Defaults to the number of CPUs
+                    save_every:int=256,  # save new results to the cache this often so interrupted runs can resume
+                   ) -> np.array: # pixel radiance (W/m^2/sr/μm) for each input
+    """Run 6SV on `inputs` in a process pool, skipping inputs that are already in the cache. 
+    The cache key is a hash of the 6SV executable and input file so it covers the 6SV build, geometry, atmosphere, aerosol, 
+    altitude, ground reflectance and wavelength. Raises `ExecutionError` if 6SV cannot be found, fails or gives unreadable output."""
+    exe_id = _sixs_exe_id(sixs_path)
+    keys  = [hashlib.sha1((exe_id+"\n"+inp).encode()).hexdigest() for inp in inputs]
+    cache = _load_sixs_cache(cache_path)
+    
+    todo = {k:inp for k,inp in zip(keys,inputs) if k not in cache}
+    if len(todo) > 0:
+        if n_processes is None: n_processes = num_cpus()
+        results = {}
+        with ProcessPoolExecutor(n_processes) as ex, tqdm(total=len(todo)) as pbar:
+            futures = {ex.submit(_sixs_run_input, sixs_path, inp):k for k,inp in todo.items()}
+            for fut in as_completed(futures):
+                results[futures[fut]] = fut.result()
+                pbar.update(1)
+                if len(results) >= save_every:
+                    _save_sixs_cache(cache_path,results); cache.update(results); results = {}
+        _save_sixs_cache(cache_path,results)
+        cache.update(results)
+    
+    return np.array([cache[k] for k in keys])
     
 @patch
 def run_wavelengths(self:Model6SV, wavelengths:np.array, n_threads:int = None) -> np.array:
     """Modified version of SixSHelpers.Wavelengths.run_wavelengths that has a progress bar.
-    This implementation uses threading (through Python's multiprocessing API)."""
-    from multiprocessing.dummy import Pool
+    This implementation uses a process pool (with `n_threads` processes) and only runs 6SV for inputs that are not in the cache."""
+    self.s.outputs = None
+    s = copy.deepcopy(self.s)
+    return run_sixs_inputs(s.sixs_path, [_sixs_input(s,wv) for wv in wavelengths], self.cache_path, n_threads)
     
-    if n_threads is None: n_threads = num_cpus()
-    with Pool(n_threads) as p, tqdm(total=len(wavelengths)) as pbar:
-        res = [p.apply_async( self._sixs_run_one_wavelength, args=(wavelengths[i],), 
-                callback=lambda _: pbar.update(1)) for i in range(len(wavelengths))]
-        results = [r.get() for r in res]
     
-    return np.array(results)
+
+# %% ../nbs/api/atmos.ipynb 14
+class Model6SVLUT():
+    """Lookup table of 6SV at sensor radiance over solar zenith, view zenith, altitude, visibility and water vapour."""
+    dims = ["solar_z","view_z","alt","visibility","water"]
     
+    def __init__(self, lut_path:str = None, # path to a NetCDF lookup table made by `Model6SVLUT.build`
+                ):
+        """Load the lookup table at `lut_path`."""
+        self.lut_path = lut_path
+        if lut_path is not None: self.lut = xr.open_dataarray(lut_path).load()
+        
+    @classmethod
+    def build(cls, 
+              lut_path:str,                 # NetCDF file to save the lookup table to
+              solar_z:np.array = np.arange(0,75,5), # solar zenith angles in degrees
+              view_z:np.array = np.array([0.]),     # viewing zenith angles in degrees
+              alt:np.array = np.array([0.12]),      # sensor altitudes in km
+              visibility:np.array = np.array([40.]), # aerosol visibility in km
+              water:np.array = np.array([3.]),       # water vapour column in g/cm^2
+              wavelength_array:np.array = None,     # wavelengths array in nm
+              ozone:float = 0.3,                    # ozone column in cm-atm
+              tile_type:GroundReflectance = 1.0,    # ground reflectance for spectralon panel
+              aero_profile:AeroProfile = AeroProfile.Maritime, # 6SV aerosol profile
+              sixs_path:str = None,                 # path to 6SV executable
+              cache_path:str = str(Path.home()/".cache"/"openhsi"/"6sv_cache.pkl"), # 6SV result cache. Rerunning resumes from here
+              n_processes:int = None,               # number of worker processes
+             ) -> "Model6SVLUT":
+        """Run 6SV over the grid in parallel and save the lookup table."""
+        if wavelength_array is None: wavelength_array = np.arange(400,800,4)
+        coords = dict(zip(cls.dims,[np.atleast_1d(np.asarray(c,dtype=np.float64)) for c in (solar_z,view_z,alt,visibility,water)]))
+        
+        s = SixS(sixs_path)
+        s.aero_profile = AeroProfile.PredefinedType(aero_profile)
+        s.geometry = Geometry.User()
+        s.altitudes = Altitudes()
+        s.altitudes.set_target_sea_level()
+        if tile_type is not None: s.ground_reflectance = GroundReflectance.HomogeneousLambertian(tile_type)
+        
+        inputs = []
+        for sz, vz, a, vis, w in itertools.product(*coords.values()):
+            s.geometry.solar_z, s.geometry.view_z = sz, vz
+            s.altitudes.set_sensor_custom_altitude(a)
+            s.visibility = vis
+            s.atmos_profile = AtmosProfile.UserWaterAndOzone(w, ozone)
+            inputs += [_sixs_input(s,wv/1e3) for wv in wavelength_array]
+        
+        radiance = run_sixs_inputs(s.sixs_path, inputs, cache_path, n_processes)
+        lut = xr.DataArray(radiance.reshape(*[len(c) for c in coords.values()],len(wavelength_array)).astype(np.float32),
+                           coords={**coords,"wavelength":np.asarray(wavelength_array,dtype=np.float64)}, 
+                           dims=[*cls.dims,"wavelength"], name="radiance", attrs={"units":"W/m^2/sr/μm"})
+        lut.to_netcdf(lut_path)
+        return cls(lut_path)
+    
+    def interpolator(self, wavelengths:np.array, # wavelengths in nm to interpolate the lookup table to
+                    ) -> Callable[[np.ndarray],np.ndarray]:
+        """Interpolator from points with columns `dims` to radiance (uW/cm^2/sr/nm) at `wavelengths`. 
+        Dimensions with only one grid value are not interpolated over."""
+        lut = self.lut.interp(wavelength=wavelengths,kwargs={"fill_value":"extrapolate"})/10 # to uW/cm^2/sr/nm
+        used = [i for i,d in enumerate(self.dims) if lut.sizes[d] > 1]
+        lut = lut.squeeze([d for d in self.dims if lut.sizes[d] == 1],drop=True)
+        if len(used) == 0: return lambda points: np.broadcast_to(lut.values,(len(points),len(wavelengths)))
+        rgi = RegularGridInterpolator([self.lut[self.dims[i]].values for i in used], lut.values, bounds_error=False, fill_value=None)
+        return lambda points: rgi(np.asarray(points)[:,used])
+    
+    def _conditions(self, kwargs:dict) -> List[np.ndarray]:
+        """Broadcast the values for `dims` in `kwargs`. Dimensions with one grid value can not be interpolated 
+        so asking for any other value raises a ValueError."""
+        unknown = set(kwargs) - set(self.dims)
+        if unknown: raise TypeError(f"Unknown lookup table dimensions {sorted(unknown)}. Expected some of {self.dims}.")
+        for d in self.dims:
+            grid = self.lut[d].values
+            if d in kwargs and len(grid) == 1 and not np.allclose(kwargs[d],grid[0]):
+                raise ValueError(f"The lookup table was built at {d} = {grid[0]} only, so {d} = {kwargs[d]} can not be interpolated.")
+        return np.broadcast_arrays(*[np.asarray(kwargs.get(d,self.lut[d].values[0]),dtype=np.float64) for d in self.dims])
+    
+    def __call__(self, 
+                 wavelengths:np.array, # wavelengths in nm
+                 **kwargs, # values for `dims`. Scalars or arrays that broadcast together. Missing dims use the first grid value
+                ) -> np.ndarray: # radiance (uW/cm^2/sr/nm) with shape (*broadcast shape, len(wavelengths))
+        """Interpolate the at sensor radiance for the given conditions."""
+        vals  = self._conditions(kwargs)
+        shape = vals[0].shape
+        points = np.stack([v.ravel() for v in vals],axis=-1)
+        return self.interpolator(wavelengths)(points).reshape(*shape,len(wavelengths))
     
+    def rad2ref(self, 
+                radiance:np.ndarray,  # radiance (uW/cm^2/sr/nm) with wavelength in the last axis, e.g. `DataCube.dc.data`
+                wavelengths:np.array, # wavelengths in nm of the last axis
+                **kwargs, # values for `dims` that broadcast to `radiance.shape[:-1]`, e.g. a solar zenith per along-track line
+               ) -> np.ndarray: # reflectance
+        """Convert radiance to reflectance with conditions that can vary per line or per pixel."""
+        vals = self._conditions(kwargs)
+        # only interpolate the unique conditions
+        uniq, inv = np.unique(np.stack([v.ravel() for v in vals],axis=-1),axis=0,return_inverse=True)
+        rad_6SV = self.interpolator(wavelengths)(uniq).astype(np.float32)[inv.ravel()]
+        return radiance / rad_6SV.reshape(*vals[0].shape,len(wavelengths))
 
 # %% ../nbs/api/atmos.ipynb 17
 def remap(x, in_min, in_max, out_min, out_max):
@@ -199,16 +451,35 @@ class SpectralLibrary():
         return hv.Overlay(curve_list).opts(**plot_opts,xlabel="wavelength (nm)",ylabel="reflectance",ylim=(0,1.1),
                                            title=f"top match: {topk['label'][0]}")       
         
+    def fit_splines(self):
+        """Fit cubic splines to all the spectra in the original library. Spectra without NaNs are fitted together."""
+        wavelengths = self.orig_speclib["wavelength"].to_numpy(dtype=np.float64)
+        self.labels = [c for c in self.orig_speclib.columns if c != "wavelength"]
+        data  = self.orig_speclib[self.labels].to_numpy(dtype=np.float64)
+        order = np.argsort(wavelengths)
+        wavelengths, data = wavelengths[order], data[order]
+        
+        valid = ~np.isnan(data)
+        self.dense_idx = np.flatnonzero(valid.all(axis=0))
+        self.dense_spline = make_interp_spline(wavelengths, data[:,self.dense_idx], k=3) if len(self.dense_idx) > 0 else None
+        self.sparse_splines = {j:make_interp_spline(wavelengths[valid[:,j]], data[valid[:,j],j], k=3) for j in np.flatnonzero(~valid.all(axis=0)) 
+                               if valid[:,j].sum() >= 4}
+        self.fitted_speclib = self.orig_speclib
+        self.interp_cache = {}
+        
     def interp(self, wavelengths:np.array):
-        """Interpolate all the spectra in the library to the new `wavelengths`."""
+        """Interpolate all the spectra in the library to the new `wavelengths`. Results are cached for each wavelength grid."""
         self.wavelengths = wavelengths
-        self.speclib = self.orig_speclib.copy()
-        self.speclib.insert(0,"type","USGS")
-        self.speclib = pd.concat( [ pd.DataFrame({"type":"openhsi","wavelength":wavelengths}), self.speclib] )
-        self.speclib.set_index("wavelength",inplace=True)
-        self.speclib.interpolate(method="cubicspline",axis="index",limit_direction="both",inplace=True)
-        self.speclib = self.speclib[self.speclib["type"].str.match("openhsi")]
-        self.speclib.drop(labels="type", axis=1,inplace=True)
+        if getattr(self,"fitted_speclib",None) is not self.orig_speclib: self.fit_splines()
+        
+        key = np.asarray(wavelengths,dtype=np.float64).tobytes()
+        if key not in self.interp_cache:
+            wavelengths = np.asarray(wavelengths,dtype=np.float64)
+            interped = np.full((len(wavelengths),len(self.labels)),np.nan,dtype=np.float32)
+            if self.dense_spline is not None: interped[:,self.dense_idx] = self.dense_spline(wavelengths)
+            for j, spline in self.sparse_splines.items(): interped[:,j] = spline(wavelengths)
+            self.interp_cache[key] = pd.DataFrame(interped,columns=self.labels,index=pd.Index(wavelengths,name="wavelength"))
+        self.speclib = self.interp_cache[key].copy()
         
     def dump(self, save_path:str=None):
         """Dump the spectral library to file. If no `save_path` provided, overwrite the original file."""
@@ -248,6 +519,103 @@ def import_USGS(self:SpectralLibrary,directory:str,sort:bool=False):
     self.interp(self.wavelengths)
     print(f"Added folder of ASD spectra to spectral library")
 
+# %% ../nbs/api/atmos.ipynb 31
+class SpectralIndex():
+    """Inverted file index for approximate spectral angle matching against large spectral libraries.
+    Library spectra are clustered in a PCA reduced space and only the `n_probe` closest clusters are searched exactly."""
+    def __init__(self,unit:np.ndarray,      # unit normalised library spectra with shape (wavelengths, library)
+                 n_lists:int = None,         # number of clusters. Defaults to the square root of the library size
+                 n_probe:int = 8,            # number of clusters searched for each query
+                 n_components:int = 16,      # PCA dimensions used to assign queries to clusters
+                 n_iter:int = 20,            # k-means iterations
+                 seed:int = 0,               # random seed for the k-means initialisation
+                ):
+        """Cluster the library and store the spectra contiguously per cluster. Spectra with non-finite values are left out 
+        and their library indices are kept in `excluded`."""
+        unit = np.ascontiguousarray(unit.T,dtype=np.float32) # (library, wavelengths)
+        finite = np.isfinite(unit).all(axis=1)
+        if not finite.any(): raise ValueError("No library spectra are finite.")
+        self.n_library = len(unit)
+        self.excluded  = np.flatnonzero(~finite)
+        library_idx    = np.flatnonzero(finite)
+        unit = unit[finite]
+        self.n_probe = n_probe
+        self.mean = unit.mean(axis=0)
+        _, _, vt = np.linalg.svd(unit - self.mean, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:n_components].T)
+        reduced = (unit - self.mean) @ self.components
+        
+        n_lists = min(n_lists or max(1,int(np.sqrt(len(unit)))), len(unit))
+        rng = np.random.default_rng(seed)
+        centroids = reduced[rng.choice(len(unit),n_lists,replace=False)]
+        for _ in range(n_iter): # Lloyd's algorithm
+            labels = self._nearest(reduced,centroids,1)[:,0]
+            counts = np.bincount(labels,minlength=n_lists)
+            sums   = np.zeros_like(centroids)
+            np.add.at(sums,labels,reduced)
+            centroids[counts > 0] = sums[counts > 0]/counts[counts > 0,None]
+        labels = self._nearest(reduced,centroids,1)[:,0]
+        
+        keep = np.unique(labels) # drop empty clusters
+        self.centroids = np.ascontiguousarray(centroids[keep])
+        labels  = np.searchsorted(keep,labels)
+        order = np.argsort(labels,kind="stable")
+        self.offsets = np.searchsorted(labels[order],np.arange(len(keep)+1))
+        self.vectors = np.ascontiguousarray(unit[order])
+        self.order   = library_idx[order].astype(np.int32) # library index of each stored vector
+        self.n_lists = len(keep)
+        
+    @staticmethod
+    def _nearest(x:np.ndarray, centroids:np.ndarray, n:int) -> np.ndarray:
+        """Indices of the `n` closest `centroids` to each row of `x`."""
+        dist = (centroids**2).sum(axis=1) - 2*x @ centroids.T
+        if n >= dist.shape[1]: return np.broadcast_to(np.arange(dist.shape[1]),dist.shape)
+        if n == 1: return np.argmin(dist,axis=1)[:,None]
+        return np.argpartition(dist,n,axis=1)[:,:n]
+    
+    def search(self,queries:np.ndarray,   # spectra with wavelengths in the last axis
+               k:int = 5,                 # number of top matches
+               n_probe:int = None,        # clusters to search. Defaults to `self.n_probe`
+              ) -> Tuple[np.ndarray,np.ndarray]: # library indices and cosine scores with shape (queries, k), best first
+        """Approximate top `k` spectral angle matches. Missing matches have index -1 and score -inf."""
+        q = np.atleast_2d(np.asarray(queries,dtype=np.float32))
+        q_norm = norm(q,axis=1,keepdims=True)
+        q = q/np.where(q_norm > 0,q_norm,1)
+        probe = self._nearest((q - self.mean) @ self.components, self.centroids, n_probe or self.n_probe)
+        
+        best_scores = np.full((len(q),k),-np.inf,dtype=np.float32)
+        best_idxs   = np.full((len(q),k),-1,dtype=np.int32)
+        # group the (query, cluster) pairs by cluster so each cluster is one matrix multiply
+        pairs = np.argsort(probe,axis=None,kind="stable")
+        lists = probe.ravel()[pairs]
+        bounds = np.searchsorted(lists,np.arange(self.n_lists+1))
+        for l in range(self.n_lists):
+            qs = pairs[bounds[l]:bounds[l+1]] // probe.shape[1]
+            if len(qs) == 0: continue
+            a, b = self.offsets[l], self.offsets[l+1]
+            scores = np.concatenate([best_scores[qs], q[qs] @ self.vectors[a:b].T],axis=1)
+            idxs   = np.concatenate([best_idxs[qs], np.broadcast_to(self.order[a:b],(len(qs),b-a))],axis=1)
+            top = np.argpartition(scores,-k,axis=1)[:,-k:]
+            best_scores[qs] = np.take_along_axis(scores,top,axis=1)
+            best_idxs[qs]   = np.take_along_axis(idxs,top,axis=1)
+        
+        order = np.argsort(-best_scores,axis=1)
+        return np.take_along_axis(best_idxs,order,axis=1), np.take_along_axis(best_scores,order,axis=1)
+    
+    def recall(self,queries:np.ndarray, # spectra with wavelengths in the last axis
+               k:int = 5,               # number of top matches
+               n_probe:int = None,      # clusters to search. Defaults to `self.n_probe`
+              ) -> float:               # fraction of the exact top `k` matches that were found
+        """Recall of `search` compared to an exhaustive search over the library. Ties with the k-th best match count as found."""
+        q = np.atleast_2d(np.asarray(queries,dtype=np.float32))
+        idxs, _ = self.search(q,k,n_probe)
+        exact = (q/norm(q,axis=1,keepdims=True)) @ self.vectors.T
+        k = min(k,exact.shape[1])
+        kth = np.partition(exact,-k,axis=1)[:,-k]
+        pos = np.zeros(self.n_library,dtype=self.order.dtype); pos[self.order] = np.arange(len(self.order)) # library index -> stored position
+        found = np.take_along_axis(exact,pos[np.maximum(idxs[:,:k],0)],axis=1) >= kth[:,None]
+        return float(np.mean(found & (idxs[:,:k] >= 0)))
+
 # %% ../nbs/api/atmos.ipynb 32
 @delegates()
 class SpectralMatcher(SpectralLibrary):
@@ -272,6 +640,8 @@ class SpectralMatcher(SpectralLibrary):
         self.speclib_ref  = self.speclib.copy()                # reflectances
         self.spectra      = (self.speclib[:].T*self.rad_6SV).T # radiances
         self.spectra_norm = norm(self.spectra,axis=0)          # vector lengths
+        self.spectra_unit = np.ascontiguousarray(self.spectra.to_numpy(dtype=np.float32)/np.float32(self.spectra_norm)) # (λ, library) unit vectors
+        if getattr(self,"index_kwargs",None) is not None: self.build_index(**self.index_kwargs)
     
     def show(self,plot_lib:str="bokeh", # choose between "bokeh" or "matplotlib" plotting backends
              is_rad:bool=False, # choose to show in radiance
@@ -291,60 +661,107 @@ class SpectralMatcher(SpectralLibrary):
                      refine=True,      # minimise the amplitude differences once similar spectra are found 
                     ) -> pd.DataFrame: # results sorted from best match to worst
         """Match a `spectrum` against a spectral library `spectra`. Return the top k. 
-        Set `refine` to find closest match using mean squared error on the top k results."""
+        Set `refine` to find closest match using mean squared error on the top k results.
+        Uses the approximate `index` if one was built with `build_index`."""
         self.refine = refine
 
         self.last_spectra = np.array(spectrum)
-        cosine_dist       = self.last_spectra @ self.spectra / ( norm(self.last_spectra) * self.spectra_norm ) # less than O(n^3)
-        topk_idx          = np.argpartition(cosine_dist, -k)[-k:]             # linear time rather than n log n
-        self.topk_idx     = topk_idx[np.argsort(cosine_dist[topk_idx])][::-1] # k log k
+        if getattr(self,"index",None) is not None:
+            topk_idx, topk_score = self.index.search(self.last_spectra,k)
+            found = topk_idx[0] >= 0
+            self.topk_idx, topk_score = topk_idx[0][found], np.float64(topk_score[0][found])
+        else:
+            cosine_dist       = self.last_spectra @ self.spectra / ( norm(self.last_spectra) * self.spectra_norm ) # less than O(n^3)
+            topk_idx          = np.argpartition(cosine_dist, -k)[-k:]             # linear time rather than n log n
+            self.topk_idx     = topk_idx[np.argsort(cosine_dist[topk_idx])][::-1] # k log k
+            topk_score        = cosine_dist[self.topk_idx]
 
         if refine and k > 1:
             topk_spectra    = self.spectra[ self.speclib.columns[self.topk_idx] ].to_numpy().transpose()
             residuals       = norm(topk_spectra - self.last_spectra, axis=1)
             residuals       = remap(residuals, min(residuals),max(residuals),0,0.1)
-            subset_topk_idx = np.argsort(cosine_dist[self.topk_idx] - residuals)[::-1]
+            subset_topk_idx = np.argsort(topk_score - residuals)[::-1]
             self.topk_idx   = self.topk_idx[subset_topk_idx]
 
-            self.sim_df = pd.DataFrame({"label":self.speclib.columns[self.topk_idx],"score":cosine_dist[self.topk_idx]-residuals[subset_topk_idx]})
+            self.sim_df = pd.DataFrame({"label":self.speclib.columns[self.topk_idx],"score":topk_score[subset_topk_idx]-residuals[subset_topk_idx]})
             return self.sim_df
 
-        self.sim_df = pd.DataFrame({"label":self.speclib.columns[self.topk_idx],"score":cosine_dist[self.topk_idx]})
+        self.sim_df = pd.DataFrame({"label":self.speclib.columns[self.topk_idx],"score":topk_score})
         return self.sim_df
 
-# %% ../nbs/api/atmos.ipynb 34
+# %% ../nbs/api/atmos.ipynb 35
 @patch
-def topk_spectra(self:SpectralMatcher,spectrum:np.array,k:int=5,refine=True):
-    """Match a `spectrum` against a spectral library `spectra`. Return the top k. 
-    Set `refine` to find closest match using mean squared error on the top k results."""
-    self.refine = refine
-
-    self.last_spectra = np.array(spectrum)
-    cosine_dist       = self.last_spectra @ self.spectra / ( norm(self.last_spectra) * self.spectra_norm ) # less than O(n^3)
-    topk_idx          = np.argpartition(cosine_dist, -k)[-k:]             # linear time rather than n log n
-    self.topk_idx     = topk_idx[np.argsort(cosine_dist[topk_idx])][::-1] # k log k
-
-    if refine and k > 1:
-        topk_spectra    = self.spectra[ self.speclib.columns[self.topk_idx] ].to_numpy().transpose()
-        residuals       = norm(topk_spectra - self.last_spectra, axis=1)
-        residuals       = remap(residuals, min(residuals),max(residuals),0,0.1)
-        subset_topk_idx = np.argsort(cosine_dist[self.topk_idx] - residuals)[::-1]
-        self.topk_idx   = self.topk_idx[subset_topk_idx]
-
-        self.sim_df = pd.DataFrame({"label":self.speclib.columns[self.topk_idx],"score":cosine_dist[self.topk_idx]-residuals[subset_topk_idx]})
-        return self.sim_df
+def classify(self:SpectralMatcher, 
+             cube:np.ndarray,     # radiance with wavelengths in the last axis matching `wavelengths`. Can be lazy (memmap, xarray)
+             k:int = 1,           # number of top matches per pixel
+             block_sz:int = 2**15, # approximate number of pixels per matrix multiply
+             use_index:bool = True, # use the approximate `index` if one was built with `build_index`
+            ) -> Tuple[np.ndarray,np.ndarray]: # library indices and cosine scores, both with shape (*cube.shape[:-1], k)
+    """Spectral angle mapper for a whole datacube. Pixels are matched in blocks against the normalised library 
+    using a matrix multiply. Use `speclib.columns[idxs]` to get the labels. Pixels with non-finite values 
+    (e.g. masked or saturated) get index -1 and NaN scores."""
+    shape   = cube.shape[:-1]
+    row_sz  = int(np.prod(shape[1:])) if len(shape) > 1 else 1
+    n_rows  = max(1, block_sz//max(row_sz,1))
+    k = min(k, self.spectra_unit.shape[1])
+    idxs   = np.empty((*shape,k),dtype=np.int32)
+    scores = np.empty((*shape,k),dtype=np.float32)
+    bad_spectra = ~np.isfinite(self.spectra_unit).all(axis=0) # library spectra that can never match
+    
+    for i in range(0,shape[0],n_rows):
+        x = np.asarray(cube[i:i+n_rows],dtype=np.float32).reshape(-1,cube.shape[-1])
+        valid = np.isfinite(x).all(axis=1)
+        if not valid.all(): x = x[valid]
+        if use_index and getattr(self,"index",None) is not None:
+            top, top_scores = self.index.search(x,k)
+        else:
+            x_norm = norm(x,axis=1,keepdims=True)
+            cosine = (x/np.where(x_norm > 0,x_norm,1)) @ self.spectra_unit
+            if bad_spectra.any(): cosine[:,bad_spectra] = -np.inf
+            if k == 1:   top = np.argmax(cosine,axis=1)[:,None]
+            elif k < cosine.shape[1]: top = np.argpartition(cosine,-k,axis=1)[:,-k:]
+            else:        top = np.broadcast_to(np.arange(k),cosine.shape)
+            top_scores = np.take_along_axis(cosine,top,axis=1)
+            order = np.argsort(-top_scores,axis=1) # best match first
+            top, top_scores = np.take_along_axis(top,order,axis=1), np.take_along_axis(top_scores,order,axis=1)
+        if not valid.all():
+            top_all, scores_all = np.full((len(valid),k),-1,dtype=np.int32), np.full((len(valid),k),np.nan,dtype=np.float32)
+            top_all[valid], scores_all[valid] = top, top_scores
+            top, top_scores = top_all, scores_all
+        idxs[i:i+n_rows]   = top.reshape(-1,*shape[1:],k)
+        scores[i:i+n_rows] = top_scores.reshape(-1,*shape[1:],k)
+    return idxs, scores
 
-    self.sim_df = pd.DataFrame({"label":self.speclib.columns[self.topk_idx],"score":cosine_dist[self.topk_idx]})
-    return self.sim_df
+# %% ../nbs/api/atmos.ipynb 36
+@patch
+def build_index(self:SpectralMatcher, **kwargs) -> SpectralIndex:
+    """Build an approximate `SpectralIndex` used by `topk_spectra` and `classify`. 
+    `kwargs` are passed to `SpectralIndex` and the index is rebuilt whenever the library is interpolated.
+    Check `self.index.recall` to tune `n_probe`. Library spectra with non-finite values (e.g. gaps in imported libraries)
+    are left out of the index and listed in `self.index.excluded`."""
+    self.index_kwargs = kwargs
+    self.index = SpectralIndex(self.spectra_unit,**kwargs)
+    if len(self.index.excluded) > 0:
+        warnings.warn(f"Left {len(self.index.excluded)} library spectra with non-finite values out of the index, see `index.excluded`.",stacklevel=2)
+    return self.index
+
+@patch
+def drop_index(self:SpectralMatcher):
+    """Go back to exhaustive matching."""
+    self.index_kwargs = None
+    self.index = None
 
 # %% ../nbs/api/atmos.ipynb 37
 @delegates()
 class ELC(SpectralMatcher):
     """Apply ELC for radiance datacubes"""
-    def __init__(self,nc_path:str,old_style:bool=False,**kwargs):
+    def __init__(self,nc_path:str,old_style:bool=False,
+                 chunk_sz:int=256, # along-track lines processed at a time when exporting
+                 **kwargs):
         """Load datacube at `nc_path` and setup UI."""
         
         self.nc_path = nc_path
+        self.chunk_sz = chunk_sz
         self.dc = DataCube(processing_lvl=-1)
         self.dc.load_nc(nc_path,old_style)
         self.RGB = self.dc.show("bokeh",robust=True).opts(height=250, width=1000, invert_yaxis=True,tools=["tap"],toolbar="below")
@@ -353,7 +770,7 @@ class ELC(SpectralMatcher):
         super().__init__(**kwargs)
         self.interp(self.dc.binned_wavelengths)
         self.xx = np.zeros((len(self.wavelengths),2))
-        self.data = self.dc.dc.data.copy() # so saving is done on a different datacube
+        self.data = self.dc.dc.data # exports are streamed from `nc_path` so no copy is needed
         
         self.title_txt = pn.pane.Markdown("**Interactive Empirical Line Calibrator**",)
         self.event_msg = pnw.StaticText(name="", value="Click export buttons to save desired reflectance datacubes.")
@@ -378,11 +795,8 @@ class ELC(SpectralMatcher):
         def click_func(event):
             # compute the ELC datacube
             self.event_msg.value = f"saving..."
-            self.dc.dc.data[...] = (self.data - self.b_ELC)/self.a_ELC
-            self.dc.timestamps.data = self.dc.ds_timestamps
-            save_dir = "/".join(self.nc_path.split("/")[:-1])
-            self.dc.save(save_dir,suffix="_ELC")
-            self.event_msg.value = f"ELC datacube exported to directory {save_dir}. Buttom clicked {self.export_ELC_button.clicks} time(s)"
+            save_path = correct_nc(self.nc_path,self.export_path("_ELC"),self.a_ELC,self.b_ELC,chunk_sz=self.chunk_sz)
+            self.event_msg.value = f"ELC datacube exported to {save_path}. Buttom clicked {self.export_ELC_button.clicks} time(s)"
             
         self.export_ELC_button.on_click(click_func)
         
@@ -392,11 +806,8 @@ class ELC(SpectralMatcher):
         def click_func(event):
             # compute the 6SV datacube
             self.event_msg.value = f"saving..."
-            self.dc.dc.data[...] = self.data/self.rad_6SV
-            self.dc.timestamps.data = self.dc.ds_timestamps
-            save_dir = "/".join(self.nc_path.split("/")[:-1])
-            self.dc.save(save_dir,suffix="_6SV")
-            self.event_msg.value = f"6SV datacube exported to directory {save_dir}. Buttom clicked {self.export_6SV_button.clicks} time(s)"
+            save_path = correct_nc(self.nc_path,self.export_path("_6SV"),self.rad_6SV,chunk_sz=self.chunk_sz)
+            self.event_msg.value = f"6SV datacube exported to {save_path}. Buttom clicked {self.export_6SV_button.clicks} time(s)"
             
         self.export_6SV_button.on_click(click_func)
     
@@ -453,35 +864,111 @@ class ELC(SpectralMatcher):
         def update_ELC(data):
             if data is None or len(data) == 0: return hv.Curve([])
             
-            # build up the matrices
-            A = []; b = []
+            selection = []
             data = zip(np.int32(data['x0']), np.int32(data['x1']), np.int32(data['y0']), np.int32(data['y1']) )
-            for i, (x0, x1, y0, y1) in enumerate(data):
+            for x0, x1, y0, y1 in data:
                 if y1 > y0: y0, y1 = y1, y0
-                sz = ((y0-y1)*(x1-x0),len(self.wavelengths))
-                selection = np.reshape(np.array(self.data[y1:y0,x0:x1,:]),sz)
-
-                AA = np.zeros((len(self.wavelengths),sz[0],2))
-                bb = np.zeros((len(self.wavelengths),sz[0],1))
+                selection.append(np.reshape(np.array(self.data[y1:y0,x0:x1,:]),(-1,len(self.wavelengths))))
+            
+            self.a_ELC, self.b_ELC = self.fit_ELC(np.concatenate(selection),k=5,refine=True)
+            self.xx[:,0] = self.a_ELC; self.xx[:,1] = self.b_ELC
+            return hv.Curve([])
+        self.ELC_dmap = hv.DynamicMap(update_ELC, streams=[self.box_stream])
 
-                for j in range(sz[0]):
-                    self.topk_spectra(selection[j,:],k=5,refine=True)
-                    label = self.sim_df["label"][0]
-                    AA[:,j,0] = self.speclib[label].to_numpy()
-                    bb[:,j,0] = selection[j,:]
-                AA[:,:,1] = 1
+        
 
-                A.append(AA); b.append(bb)
+# %% ../nbs/api/atmos.ipynb 38
+@patch
+def match_labels(self:SpectralMatcher, 
+                 spectra:np.ndarray, # radiance spectra with shape (pixels, wavelengths)
+                 k:int = 5,          # number of top matches to consider
+                 refine:bool = True, # minimise the amplitude differences within the top k like `topk_spectra`
+                ) -> np.ndarray:     # index of the best match in `speclib.columns` for each spectrum
+    """Best library match for many spectra at once. Spectra with non-finite values get index -1 like in `classify`."""
+    spectra = np.asarray(spectra,dtype=np.float32)
+    idxs, scores = self.classify(spectra,k=k)
+    if not refine or idxs.shape[1] < 2: return idxs[:,0]
+    
+    valid = idxs[:,0] >= 0
+    idxs, scores, spectra = idxs[valid], scores[valid], spectra[valid]
+    residuals = norm(self.spectra.to_numpy(dtype=np.float32).T[np.maximum(idxs,0)] - spectra[:,None,:],axis=2)
+    r_min, r_max = residuals.min(axis=1,keepdims=True), residuals.max(axis=1,keepdims=True)
+    residuals = remap(residuals,r_min,np.where(r_max > r_min,r_max,r_min+1),0,0.1)
+    labels = np.full(valid.shape,-1,dtype=idxs.dtype)
+    labels[valid] = np.take_along_axis(idxs,np.argmax(scores - residuals,axis=1)[:,None],axis=1)[:,0]
+    return labels
 
-            A = np.concatenate(A,axis=1); b = np.concatenate(b,axis=1)
-            x = np.linalg.pinv(A) @ b
+@patch
+def fit_ELC(self:SpectralMatcher, 
+            spectra:np.ndarray, # radiance spectra of calibration targets with shape (pixels, wavelengths)
+            **kwargs,           # passed to `match_labels`
+           ) -> Tuple[np.ndarray,np.ndarray]: # gain and offset per band so that radiance = gain*reflectance + offset
+    """Headless empirical line calibration. Targets are matched against the spectral library and 
+    a line is fit for each band in closed form. Target pixels with non-finite values are left out."""
+    spectra = np.asarray(spectra,dtype=np.float64)
+    labels = self.match_labels(spectra,**kwargs)
+    valid = labels >= 0
+    if not valid.any(): raise ValueError("None of the calibration target spectra are finite.")
+    if not valid.all():
+        warnings.warn(f"Left {(~valid).sum()} target spectra with non-finite values out of the ELC fit.",stacklevel=2)
+        labels, spectra = labels[valid], spectra[valid]
+    x = self.speclib.to_numpy(dtype=np.float64)[:,labels].T # reference reflectances
+    x_mean, y_mean = x.mean(axis=0), spectra.mean(axis=0)
+    var = ((x - x_mean)**2).mean(axis=0)
+    cov = ((x - x_mean)*(spectra - y_mean)).mean(axis=0)
+    with np.errstate(divide="ignore",invalid="ignore"):
+        a = np.where(var > 1e-12*(x_mean**2 + 1e-12), cov/var, x_mean*y_mean/(x_mean**2 + 1)) # minimum norm solution when all targets match the same reflectance
+    return a, y_mean - a*x_mean
 
-            self.xx[:,0] = x[:,0,0]; self.xx[:,1] = x[:,1,0]
-            self.a_ELC = self.xx[:,0]; self.b_ELC = self.xx[:,1]
-            return hv.Curve([])
-        self.ELC_dmap = hv.DynamicMap(update_ELC, streams=[self.box_stream])
+def apply_ELC(cube:np.ndarray,     # radiance datacube with wavelengths in the last axis
+              a:np.ndarray,        # gain per band
+              b:np.ndarray,        # offset per band
+              out:np.ndarray=None, # output array. Defaults to converting `cube` in place
+              chunk_rows:int=256,  # rows converted at a time
+             ) -> np.ndarray:      # reflectance datacube
+    """Convert radiance to reflectance using the ELC gain and offset in chunks."""
+    out = cube if out is None else out
+    if not np.issubdtype(out.dtype,np.floating):
+        raise ValueError(f"apply_ELC needs a floating point `out`, got {out.dtype}. Pass a float `out` for integer cubes.")
+    inv_a = (1/np.asarray(a,dtype=np.float64)).astype(out.dtype); b = np.asarray(b,dtype=out.dtype)
+    for i in range(0,cube.shape[0],chunk_rows):
+        chunk = np.subtract(cube[i:i+chunk_rows],b,dtype=out.dtype)
+        np.multiply(chunk,inv_a,out=out[i:i+chunk_rows],casting="unsafe")
+    return out
 
+# %% ../nbs/api/atmos.ipynb 39
+def correct_nc(nc_path:str,          # radiance datacube NetCDF saved by `DataCube.save`
+               save_path:str,        # output NetCDF path
+               gain:np.ndarray,      # per band gain. Use `rad_6SV` for 6SV reflectance
+               offset:np.ndarray=0., # per band offset
+               chunk_sz:int=256,     # along-track lines processed at a time
+              ) -> str:              # `save_path`
+    """Stream along-track chunks of a datacube through `(radiance - offset)/gain` and write them to `save_path`
+    with the same coordinates and metadata. Peak memory is bounded by `chunk_sz`."""
+    with xr.open_dataset(nc_path) as ds:
+        ds.drop_vars("datacube").to_netcdf(save_path) # coordinates and attributes
+        dims = ds.datacube.dims
+        w_ax, y_ax = dims.index("wavelength"), dims.index("y")
+        gain, offset = np.float32(gain), np.float32(offset)
         
+        with netCDF4.Dataset(save_path,"a") as nc:
+            var = nc.createVariable("datacube",np.float32,dims,fill_value=np.float32(np.nan),
+                                    chunksizes=tuple(min(chunk_sz,n) if d == "y" else n for d, n in zip(dims,ds.datacube.shape)))
+            var.setncatts(ds.datacube.attrs)
+            for i in range(0,ds.sizes["y"],chunk_sz):
+                chunk = ds.datacube.isel(y=slice(i,i+chunk_sz)).to_numpy().astype(np.float32)
+                apply_ELC(np.moveaxis(chunk,w_ax,-1),gain,offset)
+                index = [slice(None)]*len(dims); index[y_ax] = slice(i,i+chunk.shape[y_ax])
+                var[tuple(index)] = chunk
+    return save_path
+
+@patch
+def export_path(self:ELC, suffix:str) -> str:
+    """Output path for the exported datacube next to the source NetCDF, named like `DataCube.save`."""
+    save_dir = "/".join(self.nc_path.split("/")[:-1])
+    t0 = pd.to_datetime(self.dc.ds_timestamps[0])
+    Path(f"{save_dir}/{t0.strftime('%Y_%m_%d')}").mkdir(parents=True, exist_ok=True)
+    return f"{save_dir}/{t0.strftime('%Y_%m_%d')}/{t0.strftime('%Y_%m_%d-%H_%M_%S')}{suffix}.nc"
 
 # %% ../nbs/api/atmos.ipynb 48
 class DataCubeViewer():
@@ -489,37 +976,142 @@ class DataCubeViewer():
         Optional key/val pair arguement overrides (**kwargs)
         ylim
         ylabel
+    The datacube is lazily loaded. The RGB is shown from a multi-resolution pyramid so only the visible 
+    part at the screen resolution is drawn, and tapped spectra are read from file and kept in an LRU cache.
     """
     def __init__(self,
                  nc_path:str=None, # path to the NetCDF file
-                 old_style:bool=False, # if datacube is stored as cross-track, along-track, wavelength coords
+                 old_style:bool=False, # Unused. Kept for compatibility since the dims are now found by name for either axis order
                  img_aspect_ratio:float=0.25, # aspect ratio for the datacube viewer
                  box_sz:tuple=(1,1), # Any binning (nrows, ncols) around the tap point. Default is a single pixel
+                 max_px:int=1000,    # along-track pixels drawn for the visible range
+                 chunk_sz:int=512,   # along-track lines read at a time when building the pyramid
+                 cache_sz:int=256,   # number of tapped spectra kept in memory
+                 pyramid_path:str=None, # where the RGB pyramid is saved. Defaults to next to `nc_path`. Set to `False` to not save
                  **kwargs):
-        """Load datacube at `nc_path` and setup UI."""
+        """Open datacube at `nc_path` and setup UI."""
         
         self.nc_path = nc_path
-        self.dc      = DataCube(processing_lvl=-1)
-        self.dc.load_nc(nc_path,old_style)
-        self.RGB     = self.dc.show("bokeh",robust=True).opts(height=int(1000*img_aspect_ratio), width=1000, invert_yaxis=True,tools=["tap"],toolbar="below")
-        self.ylim    = (0,np.max(self.dc.dc.data))
+        self.ds      = xr.open_dataset(nc_path)
+        self.shape   = tuple(self.ds.sizes[d] for d in ("x","y","wavelength")) # cross-track, along-track, wavelength
+        self.wavelengths = np.array(self.ds.wavelength)
         self.box_sz  = box_sz
         self._bhalf = (box_sz[0]//2, box_sz[1]//1)
+        self.max_px  = max_px
+        self.chunk_sz = chunk_sz
+        self.pyramid_path = f"{os.path.splitext(nc_path)[0]}_pyramid.npz" if pyramid_path is None else pyramid_path
+        self.spectrum = lru_cache(maxsize=cache_sz)(self._spectrum)
+        
+        self.load_pyramid()
+        self.range_xy = hv.streams.RangeXY()
+        self.RGB = hv.DynamicMap(self.render, streams=[self.range_xy]).opts(
+            height=int(1000*img_aspect_ratio), width=1000, invert_yaxis=True,tools=["tap"],toolbar="below")
         
         if 'ylabel' in kwargs:
             self.ylabelplot=kwargs.get("ylabel")
         else:
-            if type(self.dc.dc.data.dtype) is np.float32:
+            if self.ds.datacube.dtype == np.float32:
                 self.ylabelplot = "radiance (uW/cm^2/sr/nm)"
-                if self.ylim[1] < 2:
+                if self.data_max < 2:
                     self.ylabelplot = "reflectance"
             else: self.ylabelplot = "digital number"
             
         if 'ylim' in kwargs: self.ylim=kwargs.get("ylim")
-        else: self.ylim = (0,np.max(self.dc.dc.data))
+        else: self.ylim = (0,self.data_max)
         
         self.title_txt = pn.pane.Markdown("**Interactive Datacube Viewer**",)
     
+    def build_pyramid(self,
+                      red_nm:float = 640.,   # Wavelength in nm to use as the red
+                      green_nm:float = 550., # Wavelength in nm to use as the green
+                      blue_nm:float = 470.,  # Wavelength in nm to use as the blue
+                      robust:Union[bool,int] = True, # Saturated linear stretch percentile
+                     ):
+        """Render the RGB bands in along-track chunks and build successively 2x downsampled levels."""
+        quicklook = QuickLook(self.wavelengths)
+        idxs = list(quicklook.band_idxs(red_nm, green_nm, blue_nm, len(self.wavelengths)))
+        n_x, n_y = self.shape[:2]
+        step = max(1, int(np.sqrt(n_x*n_y/quicklook.sample_sz)))
+        
+        # whole bands are contiguous on file so read a few spread out bands for the stretch and plot limits
+        sample_idxs = sorted(set(idxs) | set(np.linspace(0,len(self.wavelengths)-1,8).astype(int).tolist()))
+        rgb_pos = [sample_idxs.index(i) for i in idxs]
+        sample, self.data_max = [], -np.inf
+        for i in range(0,n_y,self.chunk_sz):
+            bands = self.read(y=slice(i,i+self.chunk_sz),wavelength=sample_idxs)
+            self.data_max = max(self.data_max, float(np.nanmax(bands)))
+            sample.append(bands[::step,(-i)%step::step,rgb_pos])
+        vmin, vmax, lut = quicklook.stretch(np.concatenate(sample,axis=1), robust, False)
+        
+        rgb = np.zeros((n_x,n_y,3),dtype=np.uint8)
+        quicklook.alloc_buffers((n_x,min(self.chunk_sz,n_y),3))
+        for i in range(0,n_y,self.chunk_sz):
+            bands = self.read(y=slice(i,i+self.chunk_sz),wavelength=idxs)
+            for j in range(3): quicklook.render_band(bands[...,j], rgb[:,i:i+self.chunk_sz,j], vmin, vmax, lut)
+        
+        self.levels = [rgb]
+        while self.levels[-1].shape[1] > self.max_px:
+            img = self.levels[-1]
+            img = np.pad(img,((0,img.shape[0]%2),(0,img.shape[1]%2),(0,0)),mode="edge")
+            img = img.reshape(img.shape[0]//2,2,img.shape[1]//2,2,3).mean(axis=(1,3),dtype=np.float32)
+            self.levels.append(np.uint8(img + 0.5))
+    
+    def load_pyramid(self):
+        """Load the saved RGB pyramid if it is newer than the datacube, otherwise build it and write it to `pyramid_path`.
+        If the file cannot be written (e.g. the datacube is on read-only media) the pyramid is only kept in memory."""
+        if self.pyramid_path and os.path.exists(self.pyramid_path) and os.path.getmtime(self.pyramid_path) >= os.path.getmtime(self.nc_path):
+            with np.load(self.pyramid_path) as f:
+                if f["max_px"] == self.max_px and tuple(f["shape"]) == self.shape:
+                    self.data_max = float(f["data_max"])
+                    self.levels = [f[f"level_{i}"] for i in range(int(f["n_levels"]))]
+                    return
+        self.build_pyramid()
+        if self.pyramid_path:
+            try:
+                with open(self.pyramid_path+".tmp","wb") as f:
+                    np.savez(f, max_px=self.max_px, shape=self.shape, data_max=self.data_max,
+                             n_levels=len(self.levels), **{f"level_{i}":l for i, l in enumerate(self.levels)})
+                os.replace(self.pyramid_path+".tmp",self.pyramid_path)
+            except OSError as e:
+                if os.path.exists(self.pyramid_path+".tmp"): os.remove(self.pyramid_path+".tmp")
+                warnings.warn(f"Could not save the RGB pyramid, keeping it in memory only: {e}",stacklevel=2)
+    
+    def render(self, x_range:tuple, y_range:tuple) -> hv.RGB:
+        """RGB of the visible along-track `x_range` and cross-track `y_range` from the coarsest level with enough detail."""
+        n_x, n_y = self.levels[0].shape[:2]
+        x0, x1 = (0, n_y) if x_range is None else (max(int(x_range[0]),0), min(int(np.ceil(x_range[1]))+1,n_y))
+        y0, y1 = (0, n_x) if y_range is None else (max(int(min(y_range)),0), min(int(np.ceil(max(y_range)))+1,n_x))
+        x1, y1 = max(x1,x0+1), max(y1,y0+1)
+        
+        lvl = min(len(self.levels)-1, max(0, int(np.ceil(np.log2(max((x1-x0)/self.max_px,1))))))
+        f = 2**lvl
+        img = self.levels[lvl][y0//f:-(-y1//f), x0//f:-(-x1//f)]
+        # pixel edges in full resolution coordinates. The last coarse pixel can extend past the datacube edge
+        left, bottom = (x0//f)*f - 0.5, (y0//f)*f - 0.5
+        right, top = left + img.shape[1]*f, bottom + img.shape[0]*f
+        return hv.RGB(img[::-1], bounds=(left, bottom, right, top)).opts(xlabel="along-track",ylabel="cross-track") # first row at the top of the bounds
+    
+    def close(self):
+        """Close the datacube file."""
+        self.spectrum.cache_clear()
+        self.ds.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def read(self, **indexers) -> np.ndarray:
+        """Read part of the datacube from file as cross-track, along-track, wavelength. `indexers` are passed to `isel`."""
+        return self.ds.datacube.isel(**indexers).transpose("x","y","wavelength").to_numpy()
+    
+    def _spectrum(self, x:int, y:int) -> np.ndarray:
+        """Mean spectrum in the box around along-track `x` and cross-track `y`."""
+        x_slice = slice( np.max((x-self._bhalf[1],0)), np.min((x-self._bhalf[1]+self.box_sz[1],self.shape[1])) )
+        y_slice = slice( np.max((y-self._bhalf[0],0)), np.min((y-self._bhalf[0]+self.box_sz[0],self.shape[0])) )
+        return np.mean(self.read(x=y_slice,y=x_slice),axis=(0,1))
+    
     def __call__(self):
         """Setup button callbacks and interactive stream and dynamics plots."""
         self.setup_streams()
@@ -553,13 +1145,9 @@ class DataCubeViewer():
             if x is None or y is None:
                 x = 1; y = 1
             x = int(x); y = int(y)
+            c = self.spectrum(x,y)
             
-            x_slice = slice( np.max((x-self._bhalf[1],0)), np.min((x-self._bhalf[1]+self.box_sz[1],self.dc.dc.data.shape[1])) )
-            y_slice = slice( np.max((y-self._bhalf[0],0)), np.min((y-self._bhalf[0]+self.box_sz[0],self.dc.dc.data.shape[0])) )
-            c = np.mean(self.dc.dc.data[y_slice,x_slice,:],axis=(0,1))
-            #c = self.dc.dc.data[y,x,:]
-            
-            return hv.Curve( zip(self.dc.binned_wavelengths,c), label=f"tap point at ({x},{y}),").opts(xlabel="wavelength (nm)",ylabel=self.ylabelplot,
+            return hv.Curve( zip(self.wavelengths,c), label=f"tap point at ({x},{y}),").opts(xlabel="wavelength (nm)",ylabel=self.ylabelplot,
                                                                                        ylim=self.ylim)
         self.tap_curve =  hv.DynamicMap(tap, streams=[self.posxy]).opts(shared_axes=False,height=250,width=1000)
     
@@ -1,8 +1,9 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/api/calibrate.ipynb.
 
 # %% auto 0
-__all__ = ['HgAr_lines', 'sum_gaussians', 'SettingsBuilderMixin', 'SettingsBuilderMetaclass', 'create_settings_builder',
-           'SpectraPTController']
+__all__ = ['HgAr_lines', 'sum_gaussians', 'fit_gaussians', 'fit_peaks', 'match_lines', 'fit_wavelength_rows',
+           'SettingsBuilderMixin', 'SettingsBuilderMetaclass', 'create_settings_builder', 'SpectraPTController',
+           'SpectraPTSimulator']
 
 # %% ../nbs/api/calibrate.ipynb 5
 from fastcore.foundation import patch
@@ -14,20 +15,27 @@ import pandas as pd
 from scipy.interpolate import interp1d
 from PIL import Image
 from scipy.signal import decimate, medfilt
+from scipy.ndimage import median_filter
 import holoviews as hv
 hv.extension('bokeh',logo=False)
 
 from fastprogress.fastprogress import master_bar, progress_bar
 
 from scipy.signal import find_peaks, savgol_filter
-from scipy.optimize import curve_fit
+from scipy.fft import rfft, irfft, next_fast_len
 from scipy import interpolate
 from functools import reduce
+from concurrent.futures import ProcessPoolExecutor
+from fastcore.basics import num_cpus
 
 from typing import Iterable, Union, Callable, List, TypeVar, Generic, Tuple, Optional, Dict
 import datetime
+import hashlib
 import json
+import os
+from pathlib import Path
 import pickle
+import warnings
 
 # %% ../nbs/api/calibrate.ipynb 6
 from .data import *
@@ -44,12 +52,163 @@ def sum_gaussians(x:np.array, # indicies
                  ) -> np.array: # summed Gaussian curves array
     """Compute the summed Gaussians given the array indicies `x` and mushed arguments of amplitude, peak position, peak width, constant"""
     split = len(args)//3
-    A   = args[0:split]         # amplitude
-    mu  = args[split:2*split]   # peak position
-    sigma = args[split*2:-1]    # peak stdev
-    c   = args[-1]              # offset
-    return np.array( [A[i] * np.exp( - np.square( (x - mu[i])/sigma[i] ) ) 
-                        for i in range(len(A))] ).sum(axis=0) + c
+    A   = np.asarray(args[0:split])         # amplitude
+    mu  = np.asarray(args[split:2*split])   # peak position
+    sigma = np.asarray(args[split*2:-1])    # peak stdev
+    c   = args[-1]                          # offset
+    return A @ np.exp( - np.square( (np.asarray(x)[None,:] - mu[:,None])/sigma[:,None] ) ) + c
+
+def fit_gaussians(x:np.ndarray,    # pixel indices of each peak window with shape (peaks, window)
+                  y:np.ndarray,    # spectra values in each window
+                  mask:np.ndarray, # which window entries are valid
+                  p0:np.ndarray,   # initial amplitude, position, stdev, offset with shape (peaks, 4)
+                  max_iter:int = 100, # maximum Levenberg-Marquardt iterations
+                  tol:float = 1e-10,  # stop when the relative cost change of every peak is below this
+                 ) -> Tuple[np.ndarray,np.ndarray]: # fitted parameters (peaks, 4) and which fits converged
+    """Fit `A*exp(-((x-μ)/σ)^2) + c` to many peak windows at once with Levenberg-Marquardt and an analytic Jacobian."""
+    def residuals(p):
+        z = (x - p[:,1:2])/p[:,2:3]
+        g = np.exp(-z*z)
+        return (p[:,0:1]*g + p[:,3:4] - y)*mask, z, g
+    
+    p = np.array(p0,dtype=np.float64)
+    r, z, g = residuals(p)
+    cost = np.einsum("nw,nw->n",r,r)
+    lam = np.full(len(p),1e-3)
+    converged = np.zeros(len(p),dtype=bool)
+    for _ in range(max_iter):
+        Ag = p[:,0:1]*g
+        J = np.stack([g, 2*Ag*z/p[:,2:3], 2*Ag*z*z/p[:,2:3], np.ones_like(g)],axis=-1)*mask[...,None]
+        JTJ = np.einsum("nwi,nwj->nij",J,J)
+        H = JTJ + lam[:,None,None]*(JTJ*np.eye(4)) + 1e-12*np.eye(4)
+        step = np.linalg.solve(H, -np.einsum("nwi,nw->ni",J,r)[...,None])[...,0]
+        
+        p_new = p + step
+        r_new, z_new, g_new = residuals(p_new)
+        cost_new = np.einsum("nw,nw->n",r_new,r_new)
+        better = np.isfinite(cost_new) & (cost_new <= cost) & ~converged
+        converged |= better & (cost - cost_new <= tol*np.maximum(cost,1e-30))
+        p[better], r[better], z[better], g[better] = p_new[better], r_new[better], z_new[better], g_new[better]
+        cost[better] = cost_new[better]
+        lam = np.where(better, lam/10, np.minimum(lam*10, 1e10))
+        converged |= lam >= 1e10 # cannot improve any further
+        if converged.all(): break
+    return p, converged
+
+def fit_peaks(spectra:np.ndarray,         # 1D spectrum of the spectral lines image
+              filter_window:int = 1,      # filter window for scipy.signal.savgol_filter. Needs to be odd.
+              find_peaks_height:int = 10, # anything above this value is free game for a peak
+              prominence:float = 0.2,     # prominence for scipy.signal.find_peaks
+              width:float = 1.5,          # peak width for scipy.signal.find_peaks
+              distance:int = 10,          # distance for scipy.signal.find_peaks
+             ) -> Dict[str,np.ndarray]:   # amplitudes `A`, centroids `μ`, widths `σ`, `coeffs` and `filtered` spectrum
+    """Find peaks in `spectra` and refine each one by fitting a Gaussian with a local offset. Peaks that fail to fit are dropped."""
+    filtered = savgol_filter(spectra, filter_window, min(3,filter_window-1))
+    μ, props = find_peaks(filtered, height=find_peaks_height, width=width, prominence=prominence, distance=distance)
+    
+    if len(μ) == 0: raise ValueError("No peaks found.")
+    
+    # fit each peak in its own window, which is about ±3σ but does not reach halfway to the neighbouring peaks
+    σ0 = 0.5*props["widths"]
+    gaps = np.diff(μ,prepend=-np.inf,append=np.inf)
+    half = np.clip(np.ceil(3*σ0), 3, np.maximum(np.minimum(gaps[:-1],gaps[1:])//2, 3)).astype(int)
+    x = μ[:,None] + np.arange(-half.max(),half.max()+1)[None,:]
+    mask = (np.abs(x - μ[:,None]) <= half[:,None]) & (x >= 0) & (x < len(spectra))
+    y = np.float64(spectra)[np.clip(x,0,len(spectra)-1)]
+    c0 = np.min(np.where(mask,y,np.inf),axis=1)
+    
+    p, converged = fit_gaussians(np.float64(x), y, mask, np.stack([props["peak_heights"]-c0, μ, σ0, c0],axis=1))
+    ok = converged & (p[:,0] > 0) & (np.abs(p[:,1] - μ) <= half) & (p[:,2] > 0)
+    A, μ, σ = p[ok,0], p[ok,1], np.abs(p[ok,2])
+    coeffs = np.array([*A,*μ,*σ,np.median(p[ok,3]) if ok.any() else 0.]) # in the `sum_gaussians` argument order
+    return dict(A=A, μ=μ, σ=σ, c=p[ok,3], coeffs=coeffs, filtered=filtered)
+
+def match_lines(A:np.ndarray,              # peak amplitudes
+                μ:np.ndarray,              # peak centroids in pixels
+                brightest_peaks:list,      # wavelengths of the brightest peaks, brightest first
+                emission_lines:np.ndarray, # list of emission lines to match
+                top_k:int = 10,            # how many peaks to keep for the final fit
+                max_match_error:float = 2.0, # max diff between peak estimate wavelength and wavelength from line list
+                verbose:bool = False,      # more detailed diagnostic messages
+               ) -> Tuple[np.poly1d,np.ndarray,np.ndarray]: # first linear fit, matched centroids and their emission lines
+    """Pair peak centroids with emission lines using a first fit through the `brightest_peaks`."""
+    emission_lines = np.asarray(emission_lines)
+    if len(μ) < len(brightest_peaks): raise ValueError(f"Found {len(μ)} peaks but {len(brightest_peaks)} brightest peaks are needed.")
+    top_A_idx = np.flip(np.argsort(A))[:len(brightest_peaks)]
+    first_fit = np.poly1d( np.polyfit(μ[top_A_idx],brightest_peaks,1) )
+    predicted_λ = first_fit(μ)
+    if verbose: print(f"Predicted λ {predicted_λ} for column {μ}")
+    
+    # match estimated peak wavelength with real line, verify match is better than max_match_error.
+    diffs = np.abs(emission_lines[None,:] - predicted_λ[:,None])
+    if verbose: print(f"difference emission_lines - λ = {np.min(diffs,axis=1)}")
+    matched = np.min(diffs,axis=1) < max_match_error # nm
+    closest_line = emission_lines[np.argmin(diffs,axis=1)][matched]
+    centroids, matching_A = μ[matched], A[matched]
+    
+    top_A_idx = np.flip(np.argsort(matching_A))[:max(min(top_k, len(closest_line)),4)]
+    return first_fit, centroids[top_A_idx], closest_line[top_A_idx]
+
+def _fit_rows(image:np.ndarray, brightest_peaks:list, emission_lines:np.ndarray, deg:int, match_kwargs:dict, peak_kwargs:dict) -> list:
+    """Fit emission line centroids and a wavelength polynomial for each row of `image`.
+    Rows that fail give NaNs and the reason, other errors are raised."""
+    res = []
+    for spectra in image:
+        centroids = np.full(len(emission_lines),np.nan)
+        try:
+            peaks = fit_peaks(spectra,**peak_kwargs)
+            _, μ, lines = match_lines(peaks["A"],peaks["μ"],brightest_peaks,emission_lines,**match_kwargs)
+            if len(μ) <= deg: raise ValueError(f"Matched {len(μ)} lines but a degree {deg} fit needs {deg+1}.")
+            centroids[[int(np.argmin(np.abs(emission_lines - l))) for l in lines]] = μ
+            coeffs, error = np.polyfit(μ,lines,deg), ""
+        except (ValueError, np.linalg.LinAlgError) as e: # too few peaks or a singular fit
+            coeffs, error = np.full(deg+1,np.nan), str(e)
+        res.append((centroids,coeffs,error))
+    return res
+
+def fit_wavelength_rows(image:np.ndarray,        # spectral lines image with cross-track rows and spectral columns
+                        brightest_peaks:list,    # wavelengths of the brightest peaks, brightest first
+                        emission_lines:np.ndarray = HgAr_lines, # list of emission lines to match
+                        rows:np.ndarray = None,  # rows to fit. Defaults to all rows
+                        deg:int = 3,             # polynomial degree of the column to wavelength map
+                        n_processes:int = None,  # number of worker processes. Defaults to the number of CPUs. 1 runs in this process
+                        top_k:int = 10,          # how many peaks to use in fit
+                        max_match_error:float = 2.0, # max diff between peak estimate wavelength and wavelength from line list
+                        **peak_kwargs,           # passed to `fit_peaks`
+                       ) -> Dict[str,np.ndarray]:
+    """Headless wavelength calibration of many rows in parallel. Returns the fitted `rows`, emission line `centroids` 
+    (NaN where a line was not matched), polynomial `coeffs`, the `wavelength_map` for every column of those rows,
+    the `smile` as the median centroid shift in pixels relative to the centre row, and the `failed` rows with their `errors`.
+    Failed rows are NaN and give a warning."""
+    emission_lines = np.asarray(emission_lines)
+    rows = np.arange(len(image)) if rows is None else np.asarray(rows)
+    if n_processes is None: n_processes = num_cpus()
+    args = (list(brightest_peaks), emission_lines, deg, dict(top_k=top_k, max_match_error=max_match_error), peak_kwargs)
+    
+    blocks = np.array_split(rows, max(1,min(len(rows),4*n_processes)))
+    if n_processes > 1:
+        with ProcessPoolExecutor(n_processes) as ex:
+            res = list(ex.map(_fit_rows, [image[b] for b in blocks], *[[a]*len(blocks) for a in args]))
+    else:
+        res = [_fit_rows(image[b], *args) for b in blocks]
+    res = [r for block in res for r in block]
+    
+    centroids = np.array([r[0] for r in res])
+    coeffs    = np.array([r[1] for r in res])
+    failed    = np.array([bool(r[2]) for r in res],dtype=bool)
+    errors    = {int(row):r[2] for row, r in zip(rows,res) if r[2]}
+    if failed.any():
+        row = int(rows[failed][0])
+        warnings.warn(f"{failed.sum()} of {len(rows)} rows could not be fit, e.g. row {row}: {errors[row]}",stacklevel=2)
+    cols = np.arange(image.shape[1])
+    wavelength_map = np.array([np.polyval(c,cols) for c in coeffs])
+    
+    centre = centroids[np.argmin(np.abs(rows - len(image)//2))]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning) # rows without any matched lines
+        smile = np.nanmedian(centroids - centre, axis=1)
+    return dict(rows=rows, centroids=centroids, coeffs=coeffs, wavelength_map=wavelength_map, smile=smile,
+                failed=rows[failed], errors=errors)
 
 # %% ../nbs/api/calibrate.ipynb 9
 class SettingsBuilderMixin():
@@ -115,23 +274,30 @@ class SettingsBuilderMixin():
         
     def update_smile_shifts(self, 
                             show=True, # flag to show plot of smile shifts for each cross track pixel.
+                            subpixel:bool=False, # also store fractional shifts from a parabolic fit around each correlation peak
                            ) -> hv.Curve:
-        """Determine Smile and shifts to correct from spectral lines image."""
-        cropped = self.crop(self.calibration["HgAr_pic"])
+        """Determine Smile and shifts to correct from spectral lines image. 
+        Every row is cross-correlated with the centre row at once using FFTs."""
+        cropped = np.float64(self.crop(self.calibration["HgAr_pic"]))
         rows, cols = cropped.shape
 
-        window = np.int32(np.flip(cropped[rows//2,:].copy()))
-
-        shifts = np.zeros((rows,),dtype=np.int16)
-
-        for i in range(rows):
-            pattern_match = np.convolve(cropped[i,:],window,"same")
-            shifts[i] = np.argmax(pattern_match)
-
-        shifts -= cols//2
-        shifts -= np.min(shifts) # make all entries positive
-        shifts = medfilt(shifts,5).astype(np.int16) # use some median smoothing
+        # linear cross-correlation for lags -cols//2 ... cols-cols//2-1 (same as `np.convolve` with the flipped centre row)
+        n = next_fast_len(2*cols-1)
+        corr = irfft(rfft(cropped,n,axis=1,workers=-1) * np.conj(rfft(cropped[rows//2,:],n)), n, axis=1, workers=-1)
+        corr = corr[:, np.arange(-(cols//2),cols-cols//2) % n]
+        peaks = np.argmax(corr,axis=1)
+        
+        shifts = np.int16(peaks - cols//2)
+        offset = np.min(shifts) # make all entries positive
+        shifts = medfilt(shifts-offset,5).astype(np.int16) # use some median smoothing
         self.calibration["smile_shifts"] = shifts
+        
+        if subpixel:
+            inner = np.clip(peaks,1,cols-2)
+            y0, y1, y2 = (corr[np.arange(rows),inner+i] for i in (-1,0,1))
+            curvature = y0 - 2*y1 + y2
+            delta = np.where((peaks == inner) & (curvature < 0), 0.5*(y0 - y2)/np.where(curvature < 0,curvature,-1), 0.)
+            self.calibration["smile_shifts_subpixel"] = median_filter(inner - cols//2 + delta - offset,5,mode="nearest").astype(np.float32) # no zero padding at the edges
         if show:
             return hv.Curve(zip(np.arange(rows),shifts)).opts(
                             invert_axes=True,invert_yaxis=True,xlabel="row index",ylabel="pixel shift")
@@ -148,6 +314,7 @@ class SettingsBuilderMixin():
                            distance:int = 10,           # distance for scipy.signal.find_peaks
                            max_match_error:float = 2.0, # max diff between peak estimate wavelength and wavelength from line list
                            verbose:bool = False,        # more detailed diagnostic messages
+                           show:bool = True,            # flag to show the matplotlib diagnostic plots
                           ) -> hv.Curve:
         """Finds the index to wavelength map given a spectra and a list of emission lines. 
         To filter the spectra, set `filter_window` to an odd number > 1."""
@@ -159,30 +326,10 @@ class SettingsBuilderMixin():
         _num_idx     = self.settings["resolution"][1]-np.max(self.calibration["smile_shifts"]) # how many pixels kept per row
         shifted_idxs = np.arange(self.settings["resolution"][1])[_start_idx:_start_idx+_num_idx]
 
-        filtered_spec = savgol_filter(spectra, filter_window, min(3,filter_window-1))
-        μ, props      = find_peaks(filtered_spec, 
-                                   height     = find_peaks_height, 
-                                   width      = width, 
-                                   prominence = prominence, 
-                                   distance   = distance)
-        
-        A = props["peak_heights"] # amplitude
-        σ = 0.5 * props["widths"] # standard deviation
-        c = 0                     # constant
-        params0 = [*A,*μ,*σ,c]    # flatten to 1D array
-
         # refine the estimates from find_peaks by curve fitting Gaussians
-        coeffs, _ = curve_fit(sum_gaussians, np.arange(len(spectra)), spectra, p0=params0)
-        split = len(params0)//3
-        A = coeffs[:split]
-        μ = coeffs[split:2*split]
-        σ = coeffs[2*split:-1]
-
-        plt.subplots(figsize=(15,3))
-        plt.plot(filtered_spec,"b-",label="filtered spectra")
-        plt.plot(sum_gaussians(np.arange(len(spectra)),*coeffs),"r:",label="curve fit")
-        plt.legend(); plt.xlabel("array index"); plt.ylabel("digital number")
-        plt.show()
+        peaks = fit_peaks(spectra, filter_window, find_peaks_height, prominence, width, distance)
+        A, μ, σ = peaks["A"], peaks["μ"], peaks["σ"]
+        if show: self.plot_peak_fit(spectra, peaks)
 
         # interactivly confirm peak wavelengths
         top_A_idx = np.flip(np.argsort(A))[:len(brightest_peaks)]
@@ -198,44 +345,18 @@ class SettingsBuilderMixin():
 
             if verbose: print(f"top_A_idx={top_A_idx}\nA[top_A_idx]={A[top_A_idx]}\nμ[top_A_idx]={μ[top_A_idx]}\nσ[top_A_idx]={σ[top_A_idx]}\nbrightest_peaks={brightest_peaks}")
 
-        # interpolate with brightest spectral lines
-        first_fit = np.poly1d( np.polyfit(μ[top_A_idx],brightest_peaks,1) )
-        predicted_λ = first_fit(μ)
-        if verbose: print(f"Predicted λ {predicted_λ} for column {μ}")
-        
-        plt.plot(μ[top_A_idx], brightest_peaks, "xr")
-        plt.plot(np.arange(len(spectra)), first_fit(np.arange(len(spectra))))
-        plt.legend(['Identified Peaks', 'Spectra']); plt.xlabel("array index"); plt.ylabel("predicted wavelength (nm)")
-        plt.show()
-        
-        # match estimated peak wavelength with real line for final fit, verify match is better than max_match_error.
-        closest_HgAr_line, matching_centroid, matching_A  = [], [], []
-        diffs = [np.min(np.abs(HgAr_lines-λ)) for λ in predicted_λ]
-        for i in range(len(diffs)):
-            if verbose: print(f"difference HgAr_lines - λ = {diffs[i]}")
-            if diffs[i] < max_match_error: # nm
-                closest_HgAr_line.append( HgAr_lines[np.argmin(np.abs(HgAr_lines - predicted_λ[i]))] )
-                matching_centroid.append( μ[i] )
-                matching_A.append( A[i] )
-                
-        # convert to numpy array
-        closest_HgAr_line = np.asarray(closest_HgAr_line)
-        matching_centroid = np.asarray(matching_centroid)
-        matching_A        = np.asarray(matching_A)
+        # interpolate with brightest spectral lines then pair the remaining peaks with emission lines
+        first_fit, matching_centroid, closest_line = match_lines(A, μ, brightest_peaks, emission_lines, top_k, max_match_error, verbose)
+        if show: self.plot_wavelength_fit(len(spectra), first_fit, μ[top_A_idx], brightest_peaks)
         
         # preform final fit of wavelength with paired lines and peaks.        
-        top_A_idx = np.flip(np.argsort(matching_A))[:max(min(top_k, len(closest_HgAr_line)),4)]
-        final_fit = np.poly1d(np.polyfit(matching_centroid[top_A_idx], closest_HgAr_line[top_A_idx] ,3) )
-        spec_wavelengths = final_fit(matching_centroid[top_A_idx])
-        
-        plt.plot(matching_centroid[top_A_idx], closest_HgAr_line[top_A_idx], "xr")
-        plt.plot(np.arange(len(spectra)), final_fit(np.arange(len(spectra))))
-        plt.legend(['Identified Peaks', 'Spectra']); plt.xlabel("array index"); plt.ylabel("predicted wavelength (nm)")
-        plt.show()
+        final_fit = np.poly1d(np.polyfit(matching_centroid, closest_line ,3) )
+        spec_wavelengths = final_fit(matching_centroid)
+        if show: self.plot_wavelength_fit(len(spectra), final_fit, matching_centroid, closest_line)
 
         # update the calibration files
         self.calibration["wavelengths"] = final_fit(shifted_idxs)
-        linear_fit = np.poly1d( np.polyfit(matching_centroid[top_A_idx], closest_HgAr_line[top_A_idx] ,1) )
+        linear_fit = np.poly1d( np.polyfit(matching_centroid, closest_line ,1) )
         self.calibration["wavelengths_linear"] = linear_fit(shifted_idxs)
 
         # create plot of fitted spectral lines
@@ -246,8 +367,38 @@ class SettingsBuilderMixin():
         return reduce((lambda x, y: x * y), plots_list).opts(
                     xlim=(final_fit(0),final_fit(len(spectra))),ylim=(0,np.max(spectra)),
                     xlabel="wavelength (nm)",ylabel="digital number",width=700,height=200,toolbar="below")
-
     
+    def plot_peak_fit(self, spectra:np.ndarray, peaks:dict):
+        """Plot the filtered spectra and the Gaussian curve fit from `fit_peaks`."""
+        plt.subplots(figsize=(15,3))
+        plt.plot(peaks["filtered"],"b-",label="filtered spectra")
+        plt.plot(sum_gaussians(np.arange(len(spectra)),*peaks["coeffs"]),"r:",label="curve fit")
+        plt.legend(); plt.xlabel("array index"); plt.ylabel("digital number")
+        plt.show()
+    
+    def plot_wavelength_fit(self, n_cols:int, fit:np.poly1d, centroids:np.ndarray, wavelengths:np.ndarray):
+        """Plot the identified peaks and the index to wavelength `fit`."""
+        plt.plot(centroids, wavelengths, "xr")
+        plt.plot(np.arange(n_cols), fit(np.arange(n_cols)))
+        plt.legend(['Identified Peaks', 'Spectra']); plt.xlabel("array index"); plt.ylabel("predicted wavelength (nm)")
+        plt.show()
+    
+    def fit_emission_lines_rows(self,
+                                brightest_peaks:list, # list of wavelength for the brightest peaks in spectral lines image
+                                emission_lines:list = HgAr_lines, # list of emission lines to match
+                                row_stride:int = 8,   # fit every `row_stride` cross-track row (the centre row is always fit)
+                                n_processes:int = None, # number of worker processes. Defaults to the number of CPUs
+                                **kwargs,             # passed to `fit_wavelength_rows`
+                               ) -> Dict[str,np.ndarray]:
+        """Fit the emission lines on many cross-track rows in parallel without plotting. 
+        Stores the 2D `wavelength_map` (raw sensor columns) for the fitted `wavelength_map_rows` and returns all results."""
+        cropped = self.crop(self.calibration["HgAr_pic"])
+        rows = np.union1d(np.arange(0,len(cropped),row_stride), [len(cropped)//2])
+        res = fit_wavelength_rows(cropped, brightest_peaks, emission_lines, rows, n_processes=n_processes, **kwargs)
+        self.calibration["wavelength_map"] = res["wavelength_map"]
+        self.calibration["wavelength_map_rows"] = res["rows"]
+        return res
+
     def fit_HgAr_lines(self, 
                        brightest_peaks:list = [435.833,546.074,763.511], # list of wavelength for the brightest peaks in spectral lines image
                        top_k:int = 10,              # how many peaks to use in fit
@@ -440,3 +591,167 @@ class SpectraPTController():
 
     def turnOffLamp(self):
         response=self.client("ps:1:out 0")
+
+# %% ../nbs/api/calibrate.ipynb 42
+import threading
+
+class SpectraPTSimulator():
+    """Local stand-in for the SPECTRA PT-1000 S server so `SpectraPTController` and calibration runs can be tested
+    without the integrating sphere. The detector reading settles exponentially towards the selected preset."""
+    def __init__(self, 
+                 lum_preset_dict:Dict[int,int]=None, # luminance for each preset. Defaults to the `SpectraPTController` presets
+                 host:str="localhost", 
+                 port:int=3434,
+                 settle_s:float=1.0,  # time constant of the lamp output after a preset change
+                 noise:float=0.0005,  # relative noise of the detector reading
+                ):
+        if lum_preset_dict is None: lum_preset_dict = SpectraPTController.__init__.__defaults__[0]
+        self.preset_lum = {v:k for k,v in lum_preset_dict.items()}
+        self.host, self.port = host, port
+        self.settle_s, self.noise = settle_s, noise
+        self.lum_start = self.lum_target = 0.
+        self.t_change = time.monotonic()
+        self.lamp_on = True
+    
+    def luminance(self) -> float:
+        """Current detector reading."""
+        if not self.lamp_on: return 0.
+        decay = np.exp(-(time.monotonic()-self.t_change)/self.settle_s)
+        lum = self.lum_target + (self.lum_start - self.lum_target)*decay
+        return lum*(1 + self.noise*np.random.randn())
+    
+    def reply(self, msg:str) -> str:
+        """Handle one command in the same format as the SPECTRA PT-1000 S."""
+        if msg.startswith("main:1:pre"):
+            self.lum_start, self.lum_target = self.luminance(), self.preset_lum[int(msg.split()[-1])]
+            self.t_change = time.monotonic()
+        elif msg.startswith("ps:1:out"):
+            self.lamp_on = msg.split()[-1] == "1"
+        elif msg.startswith("det:1:sca?"):
+            return f"{msg};0;{self.luminance():.3f};"
+        return f"{msg};0;OK;"
+    
+    def handle(self, conn:socket.socket):
+        with conn:
+            n = int(conn.recv(4).hex(),16)
+            msg = conn.recv(n).decode()
+            conn.sendall(b"ACK")
+            time.sleep(0.002) # the controller reads the acknowledgement and the reply separately
+            conn.sendall(self.reply(msg).encode())
+    
+    def serve(self):
+        while not self.stopped.is_set():
+            try: conn, _ = self.sock.accept()
+            except socket.timeout: continue
+            self.handle(conn)
+    
+    def start(self):
+        """Start serving in a background thread."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port)); self.sock.listen()
+        self.sock.settimeout(0.1)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.stopped.set(); self.thread.join(); self.sock.close()
+    
+    def __enter__(self): return self.start()
+    
+    def __exit__(self, exc_type, exc_value, traceback): self.stop()
+
+# %% ../nbs/api/calibrate.ipynb 43
+@patch
+def avg_frames(self:SettingsBuilderMixin, 
+               n:int,           # number of images to average
+               n_discard:int=1, # images to drop first, e.g. ones taken before an exposure change
+              ) -> np.ndarray:  # averaged image
+    """Average `n` images from an already started camera using a running sum."""
+    for _ in range(n_discard): self.get_img()
+    acc = np.zeros(tuple(self.settings['resolution']),np.float64)
+    for _ in range(n): acc += self.get_img()
+    return acc/n
+
+@patch
+def run_intsphere_cube(self:SettingsBuilderMixin,
+                       exposures:List,          # exposure times for the camera to iterate over
+                       luminances:List,         # luminance values for the integrating sphere to iterate over
+                       checkpoint_dir:str,      # directory for the per (exposure, luminance) slices. Existing slices are reused
+                       controller:SpectraPTController = None, # integrating sphere controller. Defaults to `SpectraPTController()`
+                       nframes:int = 10,        # how many frames to average over
+                       dark_settle_s:float = 5, # wait after turning the lamp off for the zero luminance slices
+                      ) -> xr.DataArray:        # same layout as `update_intsphere_cube`
+    """Unattended integrating sphere calibration. The camera keeps streaming while the sphere presets are changed,
+    each averaged slice is saved to `checkpoint_dir` as soon as it is taken, and a rerun resumes from the missing slices.
+    A manifest of the camera settings is kept with the slices and resuming with different settings raises a ValueError.
+    Luminance 0 is taken with the lamp off. Timing for each slice is kept in `self.intsphere_log`."""
+    if controller is None: controller = SpectraPTController()
+    Path(checkpoint_dir).mkdir(parents=True, exist_ok=True)
+    fname = lambda e, l: f"{checkpoint_dir}/rad_ref_{float(e):g}ms_{l}cdm2.npz"
+    shape = (np.ptp(self.settings["row_slice"]), self.settings["resolution"][1], len(exposures), len(luminances))
+    self.intsphere_log = []
+    
+    # slices are only reused if they were taken with the same camera settings
+    settings = {k:v for k,v in self.settings.items() if k != "exposure_ms"} # exposure is part of the slice name
+    manifest = dict(camera=type(self).__name__, nframes=nframes, shape=[int(n) for n in shape[:2]],
+                    settings_hash=hashlib.sha1(json.dumps(settings,sort_keys=True,default=str).encode()).hexdigest())
+    manifest_path = f"{checkpoint_dir}/manifest.json"
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f: old = json.load(f)
+        changed = [k for k in manifest if old.get(k) != manifest[k]]
+        if changed: raise ValueError(f"Slices in {checkpoint_dir} were taken with a different {', '.join(changed)}. Use a new `checkpoint_dir`.")
+    elif len(list(Path(checkpoint_dir).glob("rad_ref_*.npz"))) > 0:
+        raise ValueError(f"{checkpoint_dir} has slices but no manifest so they cannot be checked. Use a new `checkpoint_dir`.")
+    else:
+        with open(manifest_path,"w") as f: json.dump(manifest,f,indent=2)
+    
+    mb = master_bar(range(len(luminances)))
+    lamp_off = False
+    self.start_cam()
+    try:
+        for i in mb:
+            todo = [j for j in range(len(exposures)) if not os.path.exists(fname(exposures[j],luminances[i]))]
+            if len(todo) == 0:
+                mb.write(f"Luminance {luminances[i]} Cd/m^2 already collected."); continue
+            
+            mb.main_bar.comment = f"Luminance = {luminances[i]} Cd/m^2 (stabilising)"
+            t0 = time.monotonic()
+            if luminances[i] == 0:
+                lamp_off = True; controller.turnOffLamp(); time.sleep(dark_settle_s)
+            else:
+                controller.turnOnLamp(); lamp_off = False; controller.selectPreset(luminances[i])
+            wait_s = time.monotonic() - t0
+            mb.main_bar.comment = f"Luminance = {luminances[i]} Cd/m^2"
+            
+            for j in progress_bar(todo, parent=mb):
+                mb.child.comment = f"exposure = {exposures[j]} ms"
+                t0 = time.monotonic()
+                self.set_exposure(exposures[j])
+                frame = self.crop(self.avg_frames(nframes)).astype(np.float32)
+                np.savez(fname(exposures[j],luminances[i])+".tmp.npz", frame=frame, exposure_ms=self.settings["exposure_ms"], wait_s=wait_s)
+                os.replace(fname(exposures[j],luminances[i])+".tmp.npz", fname(exposures[j],luminances[i])) # complete slices only
+                self.intsphere_log.append(dict(luminance=luminances[i], exposure=exposures[j], wait_s=wait_s, acquire_s=time.monotonic()-t0))
+            mb.write(f"Finished collecting at luminance {luminances[i]} Cd/m^2 after {wait_s:.1f} s of stabilisation.")
+    finally:
+        self.stop_cam()
+        if lamp_off:
+            try: controller.turnOnLamp()
+            except Exception as e: # do not hide the original error, e.g. if the sphere connection was lost
+                warnings.warn(f"Could not turn the lamp back on: {e}",stacklevel=2)
+    
+    rad_ref = np.zeros(shape,np.float32)
+    real_exposures = np.array(exposures,dtype=np.float64)
+    for i, l in enumerate(luminances):
+        for j, e in enumerate(exposures):
+            with np.load(fname(e,l)) as f:
+                rad_ref[:,:,j,i] = f["frame"]
+                real_exposures[j] = f["exposure_ms"] # store real exposure time
+    
+    return xr.Dataset(data_vars=dict(datacube=(["cross_track","wavelength_index","exposure","luminance"],rad_ref)),
+                                     coords=dict(cross_track=(["cross_track"],np.arange(shape[0])),
+                                              wavelength_index=(["wavelength_index"],np.arange(shape[1])),
+                                              exposure=(["exposure"],real_exposures),
+                                              luminance=(["luminance"],luminances)), attrs={}).datacube
@@ -18,6 +18,7 @@ import warnings
 from typing import Iterable, Union, Callable, List, TypeVar, Generic, Tuple, Optional
 import json
 import pickle
+import time
 
 # %% ../nbs/api/capture.ipynb 6
 from .data import DataCube, CircArrayBuffer
@@ -45,7 +46,8 @@ class OpenHSI(DataCube):
         """Collect the hyperspectral datacube."""
         self.start_cam()
         for i in tqdm(range(self.n_lines)):
-            self.put(self.get_img())
+            mono_ns = time.monotonic_ns() # the frame is exposed and read out while `get_img` waits for it
+            self.put(self.get_img(), mono_ns=mono_ns)
             
             if callable(getattr(self,"get_temp",None)):
                 self.cam_temperatures.put( self.get_temp() )
@@ -1,7 +1,8 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/api/data.ipynb.
 
 # %% auto 0
-__all__ = ['Shape', 'DType', 'Array', 'CircArrayBuffer', 'CameraProperties', 'DateTimeBuffer', 'DataCube']
+__all__ = ['Shape', 'DType', 'Array', 'CircArrayBuffer', 'CameraProperties', 'DateTimeBuffer', 'ClockModel', 'DataCube',
+           'QuickLook', 'LiveQuickLook']
 
 # %% ../nbs/api/data.ipynb 4
 from fastcore.foundation import patch
@@ -23,6 +24,7 @@ from datetime import datetime, timezone, timedelta
 from pathlib import Path
 import warnings
 import pprint
+import time
 
 import holoviews as hv
 hv.extension("bokeh",logo=False)
@@ -59,6 +61,7 @@ class CircArrayBuffer():
         self.read_pos  = self.write_pos.copy()
         self.slots_left = self.size[self.axis]
         self.show_func = show_func
+        self.n_puts = 0 # total number of puts, used to track new writes
         
     def __getitem__(self, key:slice):
         return self.data[key]
@@ -84,6 +87,28 @@ class CircArrayBuffer():
             self.read_pos = self._inc(self.read_pos)
         
         self.write_pos = self._inc(self.write_pos)
+        self.n_puts += 1
+    
+    def put_block(self, lines:np.ndarray):
+        """Writes a stack of (n-1)darrays (stacked along the first axis) into the buffer with at most two slice assignments. 
+        Equivalent to calling `put` on each line."""
+        n, n_buff = len(lines), self.size[self.axis]
+        if n == 0: return
+        lines = lines[-n_buff:] # older lines would be overwritten anyway
+        m = len(lines)
+        start = (self.write_pos[self.axis] + n - m) % n_buff
+        first = min(m, n_buff - start)
+        idx = list(self.write_pos)
+        for s, block in ((slice(start, start+first), lines[:first]), (slice(0, m-first), lines[first:])):
+            if len(block) == 0: continue
+            idx[self.axis] = s
+            self.data[tuple(idx)] = np.moveaxis(block, 0, self.axis)
+        
+        # if buffer full, move the read position past the overwritten slots
+        if n > self.slots_left: self.read_pos[self.axis] = (self.read_pos[self.axis] + n - self.slots_left) % n_buff
+        self.slots_left = max(self.slots_left - n, 0)
+        self.write_pos[self.axis] = (self.write_pos[self.axis] + n) % n_buff
+        self.n_puts += n
             
     def get(self) -> np.ndarray:
         """Reads the oldest (n-1)darray from the buffer"""
@@ -169,9 +194,11 @@ def tfm_setup(self:CameraProperties,
               dtype:Union[np.uint8,np.uint16,np.float32] = np.uint16, 
               lvl:int = 0):
     """Setup for transforms"""
-    if self.fast_smile in self.tfm_list:
+    smile = self.precise_smile if self.precise_smile in self.tfm_list else self.fast_smile
+    if smile in self.tfm_list:
         self.smiled_size = (np.ptp(self.settings["row_slice"]), self.settings["resolution"][1] - np.max(self.calibration["smile_shifts"]) )
-        self.line_buff = CircArrayBuffer(self.smiled_size, axis=0, dtype=dtype)
+        if smile == self.fast_smile: self.line_buff = CircArrayBuffer(self.smiled_size, axis=0, dtype=dtype)
+        else: self.precise_smile_setup()
     
         # for collapsing spectral pixels into bands
         self.byte_sz = dtype(0).nbytes 
@@ -193,7 +220,9 @@ def tfm_setup(self:CameraProperties,
         self.λs = np.around(np.array([np.min(self.calibration["wavelengths"]) + i*self.settings["fwhm_nm"] for i in range(n_bands+1)]),decimals=1)
         self.bin_idxs = [np.argmin(np.abs(self.calibration["wavelengths"]-λ)) for λ in self.λs]
         self.binned_wavelengths = self.λs[:-1] + self.settings["fwhm_nm"]//2 # 
-        binned_type = np.float32 if hasattr(self,"need_rad") else dtype
+        # sub-pixel smile and radiance give fractional values that must survive binning
+        float_out = np.issubdtype(getattr(self,"dtype_out",dtype), np.floating)
+        binned_type = np.float32 if float_out or self.precise_smile in self.tfm_list else dtype
         self.bin_buff = CircArrayBuffer((np.ptp(self.settings["row_slice"]),n_bands), axis=1, dtype=binned_type)
     
     if self.dn2rad in self.tfm_list:
@@ -223,8 +252,8 @@ def tfm_setup(self:CameraProperties,
                              self.dark_current ) )
         self.spec_rad_ref = np.float32(self.calibration["sfit"](self.calibration["wavelengths"]))
     
-        self.dark_current = np.float32(self.fast_smile(self.dark_current))
-        self.ref_luminance = np.float32(self.fast_smile(self.ref_luminance))
+        self.dark_current = np.array(smile(self.dark_current),dtype=np.float32) # copy out of the reused smile buffer
+        self.ref_luminance = np.array(smile(self.ref_luminance),dtype=np.float32)
     
     if hasattr(self,"need_rad_after_fast_bin"):
         self.dark_current = np.float32(self.fast_bin(self.dark_current))
@@ -258,6 +287,43 @@ def fast_smile(self:CameraProperties, x:np.ndarray) -> np.ndarray:
 
 # %% ../nbs/api/data.ipynb 26
 @patch
+def precise_smile_setup(self:CameraProperties):
+    """Precompute the gather indices and per row weights for `precise_smile` from the fractional smile shifts.
+    Linear interpolation uses two taps and cubic (Keys, a=-0.5) uses four."""
+    shifts = np.float64(self.calibration.get("smile_shifts_subpixel", self.calibration["smile_shifts"]))
+    base = np.floor(shifts)
+    t = (shifts - base)[:,None]
+    if self.smile_interp == "cubic":
+        offsets = (-1,0,1,2)
+        weights = [((-0.5*t + 1)*t - 0.5)*t, (1.5*t - 2.5)*t*t + 1, ((-1.5*t + 2)*t + 0.5)*t, (0.5*t - 0.5)*t*t]
+    else: # linear
+        offsets = (0,1)
+        weights = [1 - t, t]
+    
+    cols = self.settings["resolution"][1]
+    rows = np.arange(self.smiled_size[0])[:,None]
+    self.smile_idxs    = [np.intp(rows*cols + np.clip(base[:self.smiled_size[0],None] + np.arange(self.smiled_size[1]) + o, 0, cols-1)) 
+                          for o in offsets] # flat indices into the cropped frame
+    self.smile_weights = [np.float32(w[:self.smiled_size[0]]) for w in weights]
+    self.smile_buff    = np.zeros(self.smiled_size, dtype=np.float32)
+    self.smile_scratch = np.zeros(self.smiled_size, dtype=np.float32)
+    self.smile_gather  = np.zeros(self.smiled_size, dtype=np.uint16)
+
+@patch
+def precise_smile(self:CameraProperties, x:np.ndarray) -> "Array['λ,x',np.float32]":
+    """Apply the sub-pixel smile correction as a weighted gather of neighbouring pixels. Use after cropping."""
+    x = np.ravel(x)
+    if self.smile_gather.dtype != x.dtype: self.smile_gather = np.zeros(self.smiled_size, dtype=x.dtype)
+    for i, (idxs, w) in enumerate(zip(self.smile_idxs, self.smile_weights)):
+        np.take(x, idxs, out=self.smile_gather)
+        if i == 0: np.multiply(self.smile_gather, w, out=self.smile_buff)
+        else:
+            np.multiply(self.smile_gather, w, out=self.smile_scratch)
+            np.add(self.smile_buff, self.smile_scratch, out=self.smile_buff)
+    return self.smile_buff
+
+# %% ../nbs/api/data.ipynb 27
+@patch
 def fast_bin(self:CameraProperties, x:np.ndarray) -> np.ndarray:
     """Changes the view of the datacube so that everything that needs to be binned is in the last axis. The last axis is then binned."""
     byte_sz=x.itemsize
@@ -265,7 +331,7 @@ def fast_bin(self:CameraProperties, x:np.ndarray) -> np.ndarray:
                         strides=(self.bin_cols*byte_sz,self.width*byte_sz,byte_sz))
     return buff.sum(axis=-1)
 
-# %% ../nbs/api/data.ipynb 27
+# %% ../nbs/api/data.ipynb 28
 @patch
 def slow_bin(self:CameraProperties, x:np.ndarray) -> np.ndarray:
     """Bins spectral bands accounting for the slight nonlinearity in the index-wavelength map"""
@@ -273,14 +339,14 @@ def slow_bin(self:CameraProperties, x:np.ndarray) -> np.ndarray:
         self.bin_buff.put( np.float32(x[:,self.bin_idxs[i]:self.bin_idxs[i+1]]).sum(axis=1) )
     return self.bin_buff.data
 
-# %% ../nbs/api/data.ipynb 28
+# %% ../nbs/api/data.ipynb 29
 @patch
 def dn2rad(self:CameraProperties, x:"Array['λ,x',np.uint16]") -> "Array['λ,x',np.float32]":
     """Converts digital numbers to radiance (uW/cm^2/sr/nm). Use after cropping to useable area."""
         
     return (np.float32(x) - self.dark_current) * self.settings["luminance"]/self.ref_luminance  *  self.spec_rad_ref/self.calibration['spec_rad_ref_luminance']                                               
 
-# %% ../nbs/api/data.ipynb 29
+# %% ../nbs/api/data.ipynb 30
 @patch
 def rad2ref_6SV(self:CameraProperties, x:"Array['λ,x',np.float32]") -> "Array['λ,x',np.float32]":
     """"""
@@ -292,9 +358,11 @@ def rad2ref_6SV(self:CameraProperties, x:"Array['λ,x',np.float32]") -> "Array['
         
     return x/self.rad_6SV
 
-# %% ../nbs/api/data.ipynb 30
+# %% ../nbs/api/data.ipynb 31
 @patch
-def set_processing_lvl(self:CameraProperties, lvl:int = -1, custom_tfms:List[Callable[[np.ndarray],np.ndarray]] = None):
+def set_processing_lvl(self:CameraProperties, lvl:int = -1, custom_tfms:List[Callable[[np.ndarray],np.ndarray]] = None,
+                       smile:str = "fast", # smile correction used by the recipies. "fast" shifts by whole pixels, "linear" or "cubic" resample with `precise_smile`
+                      ):
     """Define the output `lvl` of the transform pipeline. Predefined recipies include:
     -1: do not apply any transforms (default), 
     0 : raw digital numbers cropped to useable sensor area, 
@@ -306,7 +374,11 @@ def set_processing_lvl(self:CameraProperties, lvl:int = -1, custom_tfms:List[Cal
     6 : crop + fast smile + fast binning + radiance + reflectance, 
     7 : crop + fast smile + radiance + slow binning, 
     8 : crop + fast smile + radiance + slow binning + reflectance.
+    Set `smile` to "linear" or "cubic" to use the sub-pixel `precise_smile` instead of `fast_smile`.
     """
+    if smile not in ("fast","linear","cubic"):
+        raise ValueError(f"smile must be one of 'fast', 'linear' or 'cubic', not {smile!r}.")
+    self.smile_interp = smile
     if   lvl == -1:
         self.tfm_list = []
     elif lvl == 0:
@@ -332,6 +404,9 @@ def set_processing_lvl(self:CameraProperties, lvl:int = -1, custom_tfms:List[Cal
     else:
         self.tfm_list = []
     
+    if smile != "fast":
+        self.tfm_list = [self.precise_smile if f == self.fast_smile else f for f in self.tfm_list]
+    
     if custom_tfms is not None:
         self.tfm_list = listify(custom_tfms)
     
@@ -344,7 +419,7 @@ def set_processing_lvl(self:CameraProperties, lvl:int = -1, custom_tfms:List[Cal
     else:
         self.dtype_in = np.uint16
         
-    self.dtype_out = np.float32 if lvl in (2,3,4,5,6,7,8) else self.dtype_in
+    self.dtype_out = np.float32 if lvl in (2,3,4,5,6,7,8) or self.precise_smile in self.tfm_list else self.dtype_in
     
     # init other parameters
     if len(self.tfm_list) > 0:
@@ -367,18 +442,35 @@ def pipeline(self:CameraProperties, x:np.ndarray) -> np.ndarray:
 class DateTimeBuffer():
     """Records timestamps in UTC time."""
     def __init__(self, n:int = 16):
-        """Initialise a nx1 array and write index"""
-        self.data = np.arange(n).astype(datetime)
+        """Initialise a nx1 datetime64[ns] array and write index. The wall clock offset is captured once 
+        and timestamps are taken from the monotonic clock."""
+        self._data = np.zeros((n,), dtype="datetime64[ns]")
+        self.mono = np.zeros((n,), dtype=np.int64) # raw monotonic clock readings in ns
+        self.mono_valid = True # False once `data` is replaced, e.g. by timestamps loaded from file
         self.n = n
         self.write_pos = 0
+        self.offset_ns = time.time_ns() - time.monotonic_ns() # UTC time = offset + monotonic time
         
-    def __getitem__(self, key:slice) -> datetime:
-        return self.data[key]
-
-    def update(self):
+    def __getitem__(self, key:slice) -> pd.Timestamp:
+        return pd.to_datetime(self.data[key])
+    
+    @property
+    def data(self) -> np.ndarray:
+        return self._data
+    
+    @data.setter
+    def data(self, value:np.ndarray):
+        """Replacing the timestamps means `mono` no longer describes them."""
+        self._data = value
+        self.mono_valid = False
+
+    def update(self, 
+               mono_ns:int = None, # Monotonic clock reading in ns (e.g. taken at acquisition). Defaults to now
+              ):
         """Stores current UTC time in an internal buffer when this method is called."""
-        ts = datetime.timestamp(datetime.now())
-        self.data[self.write_pos] = datetime.fromtimestamp(ts, tz=timezone.utc)
+        mono_ns = time.monotonic_ns() if mono_ns is None else mono_ns
+        self.mono[self.write_pos] = mono_ns
+        self.data.view(np.int64)[self.write_pos] = self.offset_ns + mono_ns
         self.write_pos += 1
 
         # Loop back if buffer is full
@@ -386,6 +478,86 @@ class DateTimeBuffer():
             self.write_pos = 0
             
 
+# %% ../nbs/api/data.ipynb 37
+class ClockModel():
+    """Linear model mapping the monotonic clock (ns) to UTC (ns): utc = `offset_ns` + (1 + `drift`) * (mono - `ref_ns`)."""
+    def __init__(self, 
+                 offset_ns:int = 0,  # UTC time in ns at `ref_ns`
+                 drift:float = 0.,   # Fractional rate error of the monotonic clock
+                 ref_ns:int = 0,     # Monotonic clock reference point in ns
+                ):
+        self.offset_ns = int(offset_ns)
+        self.drift     = drift
+        self.ref_ns    = int(ref_ns)
+        self.residuals_ns = np.zeros((0,))
+        
+    def __repr__(self):
+        return f"ClockModel: offset = {self.offset_ns} ns, drift = {self.drift*1e6:.3f} ppm, rms residual = {self.rms_ns:.0f} ns"
+
+    @property
+    def rms_ns(self) -> float:
+        return float(np.sqrt(np.mean(self.residuals_ns**2))) if len(self.residuals_ns) else np.nan
+    
+    def __call__(self, mono_ns:np.ndarray) -> np.ndarray: # datetime64[ns] array
+        """Convert monotonic clock readings to UTC timestamps."""
+        dt = np.asarray(mono_ns, dtype=np.int64) - self.ref_ns
+        return (self.offset_ns + dt + np.round(self.drift*dt).astype(np.int64)).astype("datetime64[ns]")
+
+    @classmethod
+    def from_pps(cls, 
+                 pps_mono_ns:np.ndarray, # Monotonic clock readings of GPS PPS rising edges in ns
+                 timestamps:DateTimeBuffer = None, # Buffer to be disciplined. Its UTC - monotonic offset from capture labels each edge
+                 sys_offset_ns:int = None, # Approximate UTC - monotonic offset used to label each edge. Overrides `timestamps`
+                 latency_ns:int = 0,       # Known delay between the PPS edge and the clock reading
+                 max_resid_ns:float = 1e6, # Edges with residuals larger than this are rejected as outliers
+                ) -> "ClockModel":
+        """Fit the clock offset and drift against PPS edges, which occur on whole UTC seconds."""
+        if len(pps_mono_ns) < 2: raise ValueError("Need at least two PPS edges to fit the clock drift.")
+        sys_offset_ns = cls.capture_offset(timestamps, sys_offset_ns)
+        mono = np.asarray(pps_mono_ns, dtype=np.int64) - latency_ns
+        utc  = np.round((mono + sys_offset_ns)/1e9).astype(np.int64)*10**9 # nearest whole second
+        ref_ns = int(mono[0])
+        x = (mono - ref_ns).astype(np.float64)
+        y = (utc - utc[0]).astype(np.float64) # small numbers so float64 keeps ns precision
+        keep = np.ones(x.shape, dtype=bool)
+        for _ in range(3): # refit without outliers (missed or bounced edges)
+            slope, intercept = np.polyfit(x[keep], y[keep], 1)
+            resid = y - (slope*x + intercept)
+            new_keep = np.abs(resid) < max_resid_ns
+            if np.array_equal(new_keep, keep) or new_keep.sum() < 2: break
+            keep = new_keep
+        model = cls(int(utc[0]) + int(round(intercept)), slope - 1, ref_ns)
+        model.residuals_ns = resid[keep]
+        if (~keep).any(): warnings.warn(f"Rejected {(~keep).sum()} of {len(keep)} PPS edges as outliers.",stacklevel=2)
+        return model
+    
+    @classmethod
+    def from_rtc_offset(cls, 
+                        offset_ms:float, # System time minus sensor board RTC time in ms (as found by `rtc_offset_ms`, see `load_ancillary_log`)
+                        timestamps:DateTimeBuffer = None, # Buffer to be disciplined. Its UTC - monotonic offset from capture is corrected
+                        sys_offset_ns:int = None, # UTC - monotonic offset of the system clock. Overrides `timestamps`
+                       ) -> "ClockModel":
+        """Offset only model that aligns the system clock to the sensor board RTC."""
+        return cls(cls.capture_offset(timestamps, sys_offset_ns) - int(round(offset_ms*1e6)))
+    
+    @staticmethod
+    def capture_offset(timestamps:DateTimeBuffer, sys_offset_ns:int) -> int:
+        """UTC - monotonic offset the system clock had when `timestamps` were taken, unless `sys_offset_ns` is given. 
+        The offset now can differ by NTP steps and drift since capture."""
+        if sys_offset_ns is not None: return int(sys_offset_ns)
+        if timestamps is None: raise ValueError("Pass the `timestamps` to be disciplined (or `sys_offset_ns`) so the clock offset from capture is used.")
+        return timestamps.offset_ns
+
+# %% ../nbs/api/data.ipynb 38
+@patch
+def discipline(self:DateTimeBuffer, 
+               model:ClockModel, # Fitted clock model
+              ):
+    """Rewrite the timestamps from the recorded monotonic clock readings using `model`."""
+    if not self.mono_valid:
+        raise ValueError("Timestamps were replaced (e.g. loaded from file) so there are no monotonic clock readings to discipline.")
+    self._data = model(self.mono)
+
 # %% ../nbs/api/data.ipynb 40
 from functools import reduce
 import psutil
@@ -406,6 +578,7 @@ class DataCube(CameraProperties):
         self.set_processing_lvl(processing_lvl)
         
         self.timestamps = DateTimeBuffer(n_lines)
+        self.clock_model = None # `ClockModel` used to discipline the timestamps when saving
         self.dc_shape = (self.dc_shape[0],self.n_lines,self.dc_shape[1])
         mem_sz = self.dtype_out(0).nbytes*reduce(lambda x,y: x*y, self.dc_shape)/2**20 # MB
         mem_thresh = 0.8*psutil.virtual_memory().available/2**20 # 80% of available memory in MB
@@ -422,9 +595,12 @@ class DataCube(CameraProperties):
 
 # %% ../nbs/api/data.ipynb 42
 @patch
-def put(self:DataCube, x:np.ndarray):
+def put(self:DataCube, 
+        x:np.ndarray,       # Image from the camera
+        mono_ns:int = None, # Monotonic clock reading when `x` was acquired. Defaults to now
+       ):
     """Applies the composed tranforms and writes the 2D array into the data cube. Stores a timestamp for each push."""
-    self.timestamps.update()
+    self.timestamps.update(mono_ns)
     self.dc.put( self.pipeline(x) )
 
 # %% ../nbs/api/data.ipynb 43
@@ -442,6 +618,7 @@ def save(self:DataCube,
             attrs = json.load(json_file)
     else: attrs = {}
     if hasattr(self, "ds_metadata"): attrs = self.ds_metadata
+    if self.clock_model is not None: self.timestamps.discipline(self.clock_model)
 
     self.directory = Path(f"{save_dir}/{self.timestamps[0].strftime('%Y_%m_%d')}/").mkdir(parents=True, exist_ok=True)
     self.directory = f"{save_dir}/{self.timestamps[0].strftime('%Y_%m_%d')}"
@@ -452,13 +629,13 @@ def save(self:DataCube,
         self.coords = dict(wavelength=(["wavelength"],wavelengths),
                            x=(["x"],np.arange(self.dc.data.shape[0])),
                            y=(["y"],np.arange(self.dc.data.shape[1])),
-                           time=(["time"],self.timestamps.data.astype(np.datetime64)),
+                           time=(["time"],self.timestamps.data),
                            temperature=(["temperature"],self.cam_temperatures.data))
     else:
         self.coords = dict(wavelength=(["wavelength"],wavelengths),
                            x=(["x"],np.arange(self.dc.data.shape[0])),
                            y=(["y"],np.arange(self.dc.data.shape[1])),
-                           time=(["time"],self.timestamps.data.astype(np.datetime64))) # time coordinates can only be saved in np.datetime64 format
+                           time=(["time"],self.timestamps.data)) # time coordinates can only be saved in np.datetime64 format
 
     
     
@@ -525,11 +702,7 @@ def load_nc(self:DataCube,
             self.dc.data = np.moveaxis(np.array(ds.datacube), 0, -1)
         print(f"Allocated {mem_sz:.02f} MB of RAM for the load buffer. There was {mem_thresh/.8:.2f} MB available.")
 
-        self.ds_timestamps = ds.time.to_numpy() # type is np.datetime64. convert to datetime.datetime
-        unix_epoch = np.datetime64(0, 's')
-        one_second = np.timedelta64(1, 's')
-        seconds_since_epoch = (self.ds_timestamps - unix_epoch) / one_second
-        self.ds_timestamps = np.array([datetime.utcfromtimestamp(s) for s in seconds_since_epoch])
+        self.ds_timestamps = ds.time.to_numpy().astype("datetime64[ns]")
         self.timestamps.data = self.ds_timestamps
         self.ds_metadata = ds.attrs
 
@@ -541,8 +714,101 @@ def load_nc(self:DataCube,
         self.dc.slots_left      = 0 # indicate that the data buffer is full
 
 # %% ../nbs/api/data.ipynb 45
+class QuickLook():
+    """Renders RGB quicklooks of a datacube into a reused uint8 buffer. Band indices are cached for each
+    (red, green, blue) triple and the colour stretch is computed on a decimated sample of the chosen bands."""
+    def __init__(self,
+                 wavelengths:np.ndarray = None, # Wavelengths along the last datacube axis. If None, the middle band is used
+                 sample_sz:int = 2**16,         # Approximate number of pixels sampled to compute the stretch
+                ):
+        """Initialise the band index cache. Buffers are allocated on the first render."""
+        self.wavelengths = wavelengths
+        self.sample_sz = sample_sz
+        self.band_cache = {}
+        self.rgb = None
+
+    def set_wavelengths(self, wavelengths:np.ndarray):
+        """Update the wavelengths and clear the band index cache if they changed."""
+        if wavelengths is self.wavelengths: return
+        if wavelengths is None or self.wavelengths is None or not np.array_equal(wavelengths, self.wavelengths):
+            self.band_cache = {}
+        self.wavelengths = wavelengths
+
+    def band_idxs(self, red_nm:float, green_nm:float, blue_nm:float, n_bands:int) -> Tuple[int,int,int]:
+        """Indices of the bands closest to the RGB wavelengths. Computed once per (red, green, blue) triple."""
+        key = (red_nm, green_nm, blue_nm, n_bands)
+        if key not in self.band_cache:
+            if self.wavelengths is None or len(self.wavelengths) != n_bands:
+                self.band_cache[key] = (n_bands//2,)*3
+            else:
+                self.band_cache[key] = tuple(int(np.argmin(np.abs(self.wavelengths-nm))) for nm in (red_nm, green_nm, blue_nm))
+        return self.band_cache[key]
+
+    def stretch(self,
+                sample:np.ndarray,      # decimated pixels of the RGB bands
+                robust:Union[bool,int], # percentile for a saturated linear stretch
+                hist_eq:bool,           # use histogram equalisation
+               ) -> Tuple[float,float,np.ndarray]: # lower and upper value, lookup table for histogram equalisation
+        """Compute the stretch limits (and lookup table if `hist_eq`) from a sample of the RGB bands."""
+        if robust and not hist_eq: # scale everything to the a saturated percentile
+            if type(robust) is bool: robust = 2
+            vmin, vmax = np.nanpercentile(sample, (robust, 100-robust))
+            return vmin, vmax, None
+        elif hist_eq and not robust:
+            vmin, vmax = np.nanmin(sample), np.nanmax(sample)
+            img_hist, bins = np.histogram(sample, 256, range=(vmin, vmax if vmax > vmin else vmin+1))
+            cdf = img_hist.cumsum() # cumulative distribution function
+            return vmin, vmax, np.uint8(255 * cdf / cdf[-1])
+        elif robust and hist_eq:
+            warnings.warn("Cannot mix robust with histogram equalisation. No RGB adjustments will be made.",stacklevel=3)
+        return 0., np.nanmax(sample), None
+
+    def alloc_buffers(self, shape:Tuple[int,int,int]):
+        """Allocate the uint8 RGB buffer and the scratch buffers used while rendering."""
+        self.rgb     = np.zeros(shape, dtype=np.uint8)
+        self.scratch = np.zeros(shape[:2], dtype=np.float32)
+        self.lut_idx = np.zeros(shape[:2], dtype=np.uint8)
+
+    def render_band(self, band:np.ndarray, out:np.ndarray, vmin:float, vmax:float, lut:np.ndarray = None):
+        """Stretch a single `band` into the uint8 view `out` using the preallocated scratch buffers."""
+        scale = (256. if lut is not None else 255.)/(vmax - vmin) if vmax > vmin else 0.
+        scratch = self.scratch.reshape(-1)[:band.size].reshape(band.shape) # bands can be smaller than the buffers
+        np.subtract(band, vmin, out=scratch, casting="unsafe")
+        np.multiply(scratch, scale, out=scratch)
+        if band.dtype.kind == "f": np.nan_to_num(scratch, copy=False)
+        np.clip(scratch, 0, 255, out=scratch)
+        if lut is None:
+            np.copyto(out, scratch, casting="unsafe")
+        else:
+            lut_idx = self.lut_idx.reshape(-1)[:band.size].reshape(band.shape)
+            np.copyto(lut_idx, scratch, casting="unsafe")
+            np.take(lut, lut_idx, out=out)
+
+    def __call__(self,
+                 data:np.ndarray,        # datacube with wavelength as the last axis
+                 red_nm:float = 640.,    # Wavelength in nm to use as the red
+                 green_nm:float = 550.,  # Wavelength in nm to use as the green
+                 blue_nm:float = 470.,   # Wavelength in nm to use as the blue
+                 robust:Union[bool,int] = False, # Saturated linear stretch. E.g. setting `robust` to 2 will show the 2-98% percentile
+                 hist_eq:bool = False,   # Choose to plot using histogram equilisation
+                ) -> "Array['x,y,3',np.uint8]":
+        """Render the RGB bands of `data` into the reused uint8 buffer and return it. 
+        The next call overwrites the buffer so copy it if it needs to be kept, e.g. in a plot."""
+        idxs = self.band_idxs(red_nm, green_nm, blue_nm, data.shape[-1])
+        shape = (*data.shape[:2], 3)
+        if self.rgb is None or self.rgb.shape != shape: self.alloc_buffers(shape)
+
+        step = max(1, int(np.sqrt(shape[0]*shape[1]/self.sample_sz)))
+        sample = data[::step,::step][...,list(idxs)]
+        vmin, vmax, lut = self.stretch(sample, robust, hist_eq)
+
+        for i, b in enumerate(idxs):
+            self.render_band(data[:,:,b], self.rgb[...,i], vmin, vmax, lut)
+        return self.rgb
+
+# %% ../nbs/api/data.ipynb 46
 @patch
-def show(self:DataCube, 
+def show(self:DataCube,
          plot_lib:str = "bokeh", # Plotting backend. This can be 'bokeh' or 'matplotlib'
          red_nm:float = 640.,    # Wavelength in nm to use as the red
          green_nm:float = 550.,  # Wavelength in nm to use as the green
@@ -555,33 +821,9 @@ def show(self:DataCube,
     The plotting backend can be specified by `plot_lib` and can be "bokeh" or "matplotlib". 
     `quick_imshow` is used for saving figures quickly but cannot be used to make interactive plots. """
 
-    rgb = np.zeros( (*self.dc.data.shape[:2],3), dtype=np.float32)
-    if hasattr(self, "binned_wavelengths"):
-        rgb[...,0] = self.dc.data[:,:,np.argmin(np.abs(self.binned_wavelengths-red_nm))]
-        rgb[...,1] = self.dc.data[:,:,np.argmin(np.abs(self.binned_wavelengths-green_nm))]
-        rgb[...,2] = self.dc.data[:,:,np.argmin(np.abs(self.binned_wavelengths-blue_nm))]
-    else:
-        rgb[...,0] = self.dc.data[:,:,int(self.dc.data.shape[2] / 2)]
-        rgb[...,1] = self.dc.data[:,:,int(self.dc.data.shape[2] / 2)]
-        rgb[...,2] = self.dc.data[:,:,int(self.dc.data.shape[2] / 2)]
-
-    if robust and not hist_eq: # scale everything to the a saturated percentile
-        if type(robust) is bool: robust = 2
-        vmax = np.nanpercentile(rgb, 100-robust)
-        vmin = np.nanpercentile(rgb, robust)
-        rgb = ((rgb.astype("f8") - vmin) / (vmax - vmin)).astype("f4")
-        rgb = np.minimum(np.maximum(rgb, 0), 1)
-    elif hist_eq and not robust:
-        img_hist, bins = np.histogram(rgb.flatten(), 256, density=True)
-        cdf = img_hist.cumsum() # cumulative distribution function
-        cdf = 1. * cdf / cdf[-1] # normalize
-        img_eq = np.interp(rgb.flatten(), bins[:-1], cdf) # find new pixel values from linear interpolation of cdf
-        rgb = img_eq.reshape(rgb.shape)
-    elif robust and hist_eq:
-        warnings.warn("Cannot mix robust with histogram equalisation. No RGB adjustments will be made.",stacklevel=2)
-        rgb /= np.max(rgb)
-    else:
-        rgb /= np.max(rgb)
+    if not hasattr(self, "quicklook"): self.quicklook = QuickLook()
+    self.quicklook.set_wavelengths(getattr(self, "binned_wavelengths", None))
+    rgb = self.quicklook(self.dc.data, red_nm, green_nm, blue_nm, robust, hist_eq).copy() # the buffer is reused by the next render
 
     if quick_imshow:
         fig, ax = plt.subplots(figsize=(12,3))
@@ -599,3 +841,130 @@ def show(self:DataCube,
     else: # plot_lib == "matplotlib"
         return rgb_hv.opts(fig_inches=22).opts(
             xlabel="along-track",ylabel="cross-track",invert_yaxis=True)
+
+# %% ../nbs/api/data.ipynb 48
+from holoviews.streams import Pipe
+
+class LiveQuickLook(QuickLook):
+    """Streaming RGB quicklook of a datacube during collection. Only the along-track lines written since the last
+    `update` are converted to RGB, the stretch comes from a running histogram, and the new columns are pushed to a holoviews `Pipe`
+    as `(start, rgb)` patches. The stretch on screen is only replaced (and the whole image re-rendered) when the running
+    stretch moves by more than `restretch_tol`, so every line shown uses the same stretch."""
+    def __init__(self,
+                 cube:DataCube,          # Datacube being collected. Can also be a `SharedDataCube`
+                 red_nm:float = 640.,    # Wavelength in nm to use as the red
+                 green_nm:float = 550.,  # Wavelength in nm to use as the green
+                 blue_nm:float = 470.,   # Wavelength in nm to use as the blue
+                 robust:Union[bool,int] = 2, # Saturated linear stretch percentile. Set to `False` to use histogram equalisation
+                 n_bins:int = 1024,      # Number of bins in the running histogram. Needs to be a multiple of 256
+                 restretch_tol:float = 0.1, # Fraction of the stretch range the running stretch can move before the image is re-rendered
+                 **kwargs):
+        """Start tracking the write position of `cube.dc` and render what is already in the buffer."""
+        super().__init__(getattr(cube, "binned_wavelengths", None), **kwargs)
+        self.cube   = cube
+        self.rgb_nm = (red_nm, green_nm, blue_nm)
+        self.robust = 2 if robust is True else robust
+        self.n_bins = n_bins
+        self.restretch_tol = restretch_tol
+        self.pipe   = Pipe(data=[])
+        self.reset()
+
+    def reset(self):
+        """Clear the running histogram and start tracking the current buffer of the datacube."""
+        self.buff = self.cube.dc
+        self.set_wavelengths(getattr(self.cube, "binned_wavelengths", None))
+        self.idxs = list(self.band_idxs(*self.rgb_nm, self.buff.data.shape[-1]))
+        self.alloc_buffers((*self.buff.data.shape[:2], 3))
+        self.hist     = np.zeros((self.n_bins,), dtype=np.int64)
+        self.hist_max = 0.
+        self.n_puts   = 0    # number of lines rendered so far
+        self.lims     = None # stretch used for the lines on screen
+
+    def update_hist(self, sample:np.ndarray):
+        """Add `sample` to the running histogram, doubling the histogram range when needed."""
+        sample = sample[np.isfinite(sample)] if sample.dtype.kind == "f" else sample.ravel()
+        if sample.size == 0: return
+        smax = float(np.max(sample))
+        if self.hist_max == 0.: self.hist_max = 2.**np.ceil(np.log2(max(smax, 1.) + 1))
+        while smax >= self.hist_max: # merge neighbouring bins so the range doubles
+            self.hist = np.concatenate((self.hist.reshape(-1,2).sum(axis=1), np.zeros((self.n_bins//2,), dtype=np.int64)))
+            self.hist_max *= 2
+        idx = np.clip(sample * (self.n_bins/self.hist_max), 0, self.n_bins-1).astype(np.int32)
+        self.hist += np.bincount(idx, minlength=self.n_bins)
+
+    def running_stretch(self) -> Tuple[float,float,np.ndarray]:
+        """Stretch limits (and lookup table for histogram equalisation) from the running histogram."""
+        cdf = np.cumsum(self.hist) / max(self.hist.sum(), 1)
+        bin_sz = self.hist_max/self.n_bins
+        if self.robust:
+            vmin = np.searchsorted(cdf, self.robust/100) * bin_sz
+            vmax = (np.searchsorted(cdf, 1 - self.robust/100) + 1) * bin_sz
+            return vmin, vmax, None
+        return 0., self.hist_max, np.uint8(255 * cdf[self.n_bins//256-1::self.n_bins//256])
+
+    def restretch(self, lims:Tuple[float,float,np.ndarray]) -> bool: # whether `lims` replaced the stretch on screen
+        """Adopt `lims` if there is no stretch on screen yet or its range moved by more than `restretch_tol`."""
+        if self.lims is not None:
+            vmin, vmax = self.lims[:2]
+            if abs(lims[0] - vmin) + abs(lims[1] - vmax) <= self.restretch_tol * (vmax - vmin): return False
+        self.lims = lims
+        return True
+
+    def update(self) -> int: # number of along-track lines rendered
+        """Convert the lines written since the last update to RGB and send the changed columns through `pipe`."""
+        if self.buff is not self.cube.dc: self.reset() # buffers were swapped or reloaded
+        n_lines = self.buff.data.shape[1]
+        n_new = min(self.buff.n_puts - self.n_puts, n_lines)
+        if n_new <= 0: return 0
+        self.n_puts = self.buff.n_puts
+
+        end = self.buff.write_pos[self.buff.axis] or n_lines
+        start = end - n_new
+        slices = [slice(start, end)] if start >= 0 else [slice(start % n_lines, n_lines), slice(0, end)]
+
+        step = max(1, int(np.sqrt(self.buff.data.shape[0]*n_lines/self.sample_sz)))
+        for s in slices:
+            self.update_hist(self.buff.data[::step, s][..., self.idxs])
+        if self.restretch(self.running_stretch()): # every line on screen gets the new stretch
+            slices = [slice(0, n_lines)]
+        for s in slices:
+            for i, b in enumerate(self.idxs):
+                self.render_band(self.buff.data[:, s, b], self.rgb[:, s, i], *self.lims)
+            self.pipe.send((s.start, self.rgb[:, s]))
+        return n_new
+
+    @staticmethod
+    def to_rgba(rgb:np.ndarray) -> np.ndarray: # packed uint32 RGBA image as used by bokeh
+        """Pack an RGB uint8 image into opaque RGBA uint32 pixels."""
+        rgba = np.full((*rgb.shape[:2], 4), 255, dtype=np.uint8)
+        rgba[..., :3] = rgb
+        return rgba.view(np.uint32)[..., 0]
+
+    def show(self,
+             plot_lib:str = "bokeh", # Plotting backend. This can be 'bokeh' or 'matplotlib'
+            ) -> "Image": # a panel wrapped bokeh figure or a matplotlib figure that is patched each time `update` is called
+        """Plot the current image and patch the columns sent through `pipe` into it."""
+        n_rows, n_lines = self.rgb.shape[:2]
+        if plot_lib == "bokeh":
+            import panel as pn
+            from bokeh.plotting import figure
+            from bokeh.models import ColumnDataSource
+            source = ColumnDataSource(data=dict(image=[self.to_rgba(self.rgb)]))
+            fig = figure(width=1000, height=250, x_range=(0, n_lines), y_range=(n_rows, 0), 
+                         x_axis_label="along-track", y_axis_label="cross-track")
+            fig.image_rgba(image="image", source=source, x=0, y=0, dw=n_lines, dh=n_rows)
+            def patch(data):
+                start, rgb = data
+                source.patch({"image": [((0, slice(None), slice(start, start + rgb.shape[1])), self.to_rgba(rgb).ravel())]})
+            self.pipe.add_subscriber(patch)
+            return pn.pane.Bokeh(fig)
+        
+        fig, ax = plt.subplots(figsize=(12,3))
+        img = self.rgb.copy()
+        im = ax.imshow(img, aspect="equal"); ax.set_xlabel("along-track"); ax.set_ylabel("cross-track")
+        def patch(data):
+            start, rgb = data
+            img[:, start:start + rgb.shape[1]] = rgb
+            im.set_data(img); fig.canvas.draw_idle()
+        self.pipe.add_subscriber(patch)
+        return fig
@@ -1,8 +1,10 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/api/sensors.ipynb.
 
 # %% auto 0
-__all__ = ['packet_labels', 'decode_packet', 'GPIOInterface', 'MPInterface', 'SensorStream', 'set_pps_cb', 'clear_pps_cb',
-           'collect_sim', 'interp2camera_times', 'SensorDashboard']
+__all__ = ['packet_labels', 'decode_packet', 'packet_dtype', 'decode_packets', 'GPIOInterface', 'MPInterface',
+           'PacketReader', 'log_dtype', 'AncillaryLog', 'rtc_offset_ms', 'clean_ancillary', 'load_ancillary_log',
+           'SensorStream', 'set_pps_cb', 'clear_pps_cb', 'collect_sim', 'slerp', 'interp2camera_times', 'dashboard_labels',
+           'dashboard_dtype', 'decode_dashboard_lines', 'SensorDashboard']
 
 # %% ../nbs/api/sensors.ipynb 4
 from fastcore.foundation import patch
@@ -10,7 +12,7 @@ from fastcore.meta import delegates
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
-from scipy.interpolate import interp1d
+from scipy.interpolate import interp1d, CubicSpline
 from tqdm import tqdm
 import warnings
 from multiprocessing import Process
@@ -23,6 +25,10 @@ from pathlib import Path
 import time
 import serial
 import datetime
+import threading
+from collections import deque
+
+from .data import CircArrayBuffer
 
 # %% ../nbs/api/sensors.ipynb 6
 packet_labels = ["rpi_time","rtc_status","imu_status","air_status","gps_status",
@@ -84,6 +90,71 @@ def decode_packet(buff:"byte string"=None) -> list:
     return contents
 
 # %% ../nbs/api/sensors.ipynb 10
+packet_dtype = np.dtype({"names":  ["header","rtc_status","imu_status","air_status","gps_status",
+                                    "year","month","day","hour","minute","second","ms",
+                                    "air_offset","temp","pressure","humidity",
+                                    "imu_offset","imu_cal","quat_w","quat_x","quat_y","quat_z",
+                                    "gps_offset","latitude","longitude","altitude","num_sats","pDOP","footer"],
+                         "formats":["u1","u1","u1","u1","u1",
+                                    "<u2","u1","u1","u1","u1","u1","<u2",
+                                    "<i2","<f4","<f4","<f4",
+                                    "<i2","u1","<f4","<f4","<f4","<f4",
+                                    "<i2","<i4","<i4","<i4","u1","<u2","u1"],
+                         "offsets":[0,1,2,3,4,
+                                    6,8,9,10,11,12,14,
+                                    16,20,24,28,
+                                    32,34,36,40,44,48,
+                                    52,56,60,64,68,70,72],
+                         "itemsize":76})
+
+def decode_packets(buff:"byte string", # Stream of data packets, e.g. a raw ancillary log
+                   rpi_time:np.ndarray=None, # Time each packet was received. One for each packet found
+                   aligned:bool=False, # `buff` is already framed packets back to back, so skip the search
+                  ) -> dict: # columnar arrays keyed by `packet_labels`
+    """Decode all the packets in `buff` at once. Packets are found by their header and footer 
+    and corrupted packets are dropped."""
+    np_buff = np.frombuffer(buff,dtype=np.uint8)
+    n = packet_dtype.itemsize
+    
+    if aligned: starts = np.arange(0,len(np_buff)-n+1,n)
+    else:
+        # candidate packets start with '*' and have '\n' at the footer
+        starts = np.flatnonzero(np_buff[:max(len(np_buff)-72,0)] == 42)
+        starts = starts[np_buff[starts+72] == 10]
+        # packets arrive back to back so trust candidates that chain with a neighbour, 
+        # and only keep the rest if they do not overlap a chained packet
+        chained = np.isin(starts+n,starts) | np.isin(starts-n,starts)
+        anchors = starts[chained]
+        pos = np.searchsorted(anchors,starts)
+        gap_prev = starts - anchors[np.clip(pos-1,0,None)] if len(anchors) else np.full(starts.shape,n)
+        gap_next = anchors[np.clip(pos,None,len(anchors)-1)] - starts if len(anchors) else np.full(starts.shape,n)
+        overlaps = ((pos > 0) & (gap_prev < n)) | ((pos < len(anchors)) & (gap_next < n))
+        starts = starts[chained | ~overlaps]
+    
+    padded = np.concatenate((np_buff,np.zeros((n,),dtype=np.uint8)))
+    recs = padded[starts[:,None] + np.arange(n)].view(packet_dtype)[:,0]
+    
+    # vectorised RTC time and masking of impossible dates
+    months = (recs["year"].astype(np.int64)-1970).astype("datetime64[Y]").astype("datetime64[M]") + (recs["month"].astype(np.int64)-1)
+    days   = months.astype("datetime64[D]") + (recs["day"].astype(np.int64)-1)
+    valid  = ((recs["month"] >= 1) & (recs["month"] <= 12) & (recs["day"] >= 1) & (days.astype("datetime64[M]") == months) &
+              (recs["hour"] < 24) & (recs["minute"] < 60) & (recs["second"] < 60) & (recs["ms"] < 1000))
+    rtc_time = (days.astype("datetime64[ms]") + recs["hour"].astype("timedelta64[h]") + recs["minute"].astype("timedelta64[m]") +
+                recs["second"].astype("timedelta64[s]") + recs["ms"].astype("timedelta64[ms]"))
+    
+    if rpi_time is None: rpi_time = np.full(len(recs),np.datetime64("NaT"),dtype="datetime64[ns]")
+    recs = recs[valid]
+    
+    cols = {"rpi_time":np.asarray(rpi_time,dtype="datetime64[ns]")[valid], "rtc_time":rtc_time[valid].astype("datetime64[ns]")}
+    for k in packet_labels:
+        if k in cols: continue
+        cols[k] = recs[k]
+    cols["latitude"]  = recs["latitude"]/1e7  # [deg]
+    cols["longitude"] = recs["longitude"]/1e7 # [deg]
+    cols["altitude"]  = recs["altitude"].astype(np.float64) # [mm above ellipsoid]
+    return {k:cols[k] for k in packet_labels}
+
+# %% ../nbs/api/sensors.ipynb 12
 class GPIOInterface():
     def __init__(self, start_pin):
         self.start_pin = start_pin
@@ -105,9 +176,15 @@ class GPIOInterface():
         except NameError:
             warnings.warn(f"GPIO requires Jetson or Raspberry Pi.",stacklevel=2)
          
+    @property
     def status(self):
         return self.GPIO.input(self.start_pin)
     
+    def wait_for_edge(self, timeout:float=1.) -> bool:
+        """Block until the toggle changes or `timeout` seconds pass, then return the status."""
+        self.GPIO.wait_for_edge(self.start_pin, self.GPIO.BOTH, timeout=int(timeout*1000))
+        return self.status
+    
 
 class MPInterface():
     def __init__(self, mp_bool):
@@ -121,8 +198,181 @@ class MPInterface():
     def status(self, value):
         self._mp_bool.value = value
     
+    def wait_for_edge(self, timeout:float=1., poll:float=0.02) -> bool:
+        """Block until the toggle changes or `timeout` seconds pass, then return the status."""
+        old, start_time = self.status, time.time()
+        while self.status == old and time.time() < start_time + timeout:
+            time.sleep(poll)
+        return self.status
+    
 
-# %% ../nbs/api/sensors.ipynb 11
+# %% ../nbs/api/sensors.ipynb 14
+class PacketReader():
+    """Drains a serial port in bulk and frames the packets. Packets start with `header` and have `footer` at `footer_pos`.
+    If `header` is None, packets are lines ending with `footer`."""
+    def __init__(self, 
+                 ser,                     # Serial port (or anything with `in_waiting` and `read(n)`)
+                 header:bytes = b"*",     # Start of packet
+                 footer:bytes = b"\n",    # End of packet
+                 packet_len:int = 76,     # Number of bytes in a packet. Minimum length if `header` is None
+                 footer_pos:int = 72,     # Position of `footer` in the packet
+                 max_buff:int = 2**20,    # Drop the oldest unframed bytes if the buffer grows larger than this
+                ):
+        self.ser = ser
+        self.header, self.footer = header, footer
+        self.packet_len, self.footer_pos = packet_len, footer_pos
+        self.max_buff = max_buff
+        self.buff = bytearray()
+        self.pos  = 0 # start of unframed bytes in `buff`
+        self.n_packets = 0 # packets framed
+        self.n_resyncs = 0 # times bytes had to be skipped to find a header
+        self.n_skipped = 0 # bytes skipped
+        self.n_corrupt = 0 # packets with a bad footer or too short
+        self.pending = deque() # packets framed but not yet returned by `read_one`
+
+    def __repr__(self):
+        return f"PacketReader: {self.n_packets} packets, {self.n_resyncs} resyncs, {self.n_skipped} bytes skipped, {self.n_corrupt} corrupt"
+    
+    def fill(self, 
+             block:bool = False, # Wait for at least one byte (up to the serial port timeout)
+            ) -> int: # number of bytes read
+        """Read everything waiting on the serial port into the buffer."""
+        n = self.ser.in_waiting
+        if block: 
+            data = self.ser.read(max(n,1)); n = len(data)
+            self.buff += data
+        elif n > 0: self.buff += self.ser.read(n)
+        if len(self.buff) - self.pos > self.max_buff:
+            self.n_skipped += len(self.buff) - self.pos - self.max_buff
+            self.pos = len(self.buff) - self.max_buff
+        return n
+    
+    def _skip(self, idx:int):
+        if idx > self.pos:
+            self.n_resyncs += 1
+            self.n_skipped += idx - self.pos
+        self.pos = idx
+        
+    def packets(self) -> Iterable[bytes]:
+        """Yield the complete packets in the buffer."""
+        while True:
+            if self.header is None:
+                end = self.buff.find(self.footer, self.pos)
+                if end < 0: break
+                pkt = bytes(self.buff[self.pos:end+1]); self.pos = end+1
+                if len(pkt) < self.packet_len: self.n_corrupt += 1; continue
+            else:
+                start = self.buff.find(self.header, self.pos)
+                if start < 0: self._skip(len(self.buff)); break
+                self._skip(start)
+                if len(self.buff) - start < self.packet_len: break
+                if self.buff[start+self.footer_pos:start+self.footer_pos+len(self.footer)] != self.footer:
+                    self.n_corrupt += 1; self.pos = start+1; continue
+                pkt = bytes(self.buff[start:start+self.packet_len]); self.pos = start+self.packet_len
+            self.n_packets += 1
+            yield pkt
+        if self.pos > len(self.buff)//2: # compact
+            del self.buff[:self.pos]; self.pos = 0
+
+    def read(self, 
+             timeout:float = 0., # Seconds to wait for at least one packet
+            ) -> List[bytes]:
+        """Drain the serial port and return the complete packets."""
+        self.fill()
+        pkts = list(self.pending) + list(self.packets())
+        self.pending.clear()
+        start_time = time.time()
+        while not pkts and time.time() < start_time + timeout:
+            time.sleep(0.001)
+            if self.fill(): pkts = list(self.packets())
+        return pkts
+    
+    def read_one(self, 
+                 timeout:float = 0., # Seconds to wait for a packet
+                ) -> bytes: # the oldest complete packet or None if none arrived
+        """Return one complete packet. Other packets framed by the same read are kept for the next call."""
+        if not self.pending: self.pending.extend(self.read(timeout))
+        return self.pending.popleft() if self.pending else None
+
+# %% ../nbs/api/sensors.ipynb 17
+log_dtype = np.dtype([("rpi_time","<i8"),("packet","u1",(packet_dtype.itemsize,))])
+
+class AncillaryLog():
+    """Append-only binary log of raw sensor packets and the system time (ns since epoch) each was received.
+    Records are a fixed size so the file can be read from any record, even if the last write was cut short."""
+    def __init__(self, fname:str):
+        self.fname = fname
+        self.f = open(fname,"ab")
+        self.n = 0 # records appended
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def append(self, 
+               packets:np.ndarray,  # Framed packets with shape (N, 76)
+               rpi_time:np.ndarray, # System time each packet was received
+              ):
+        """Append packets to the log and flush to disk."""
+        recs = np.empty((len(packets),),dtype=log_dtype)
+        recs["rpi_time"] = np.asarray(rpi_time,dtype="datetime64[ns]").view(np.int64)
+        recs["packet"]   = packets
+        self.f.write(recs.tobytes())
+        self.f.flush()
+        self.n += len(recs)
+    
+    def close(self):
+        self.f.close()
+
+def rtc_offset_ms(df:pd.DataFrame, # Decoded packets with columns `packet_labels`
+                 ) -> float: # system time minus sensor board RTC time in ms
+    """Find the time offset between the sensor board RTC and the system time (including the small delay between loops)."""
+    offset = np.nanmin(pd.to_datetime(df["rpi_time"]).to_numpy() - pd.to_datetime(df["rtc_time"]).to_numpy() - np.timedelta64(1,"ms"))
+    return offset/np.timedelta64(1,"ms")
+
+def clean_ancillary(df:pd.DataFrame, # Decoded packets with columns `packet_labels`
+                   ) -> pd.DataFrame: # sensor readings indexed by board time
+    """Converts time offsets in `df` into datetime and splits sensor readings that update 
+    at different rates. Each row holds the readings of one sensor and the other sensors are NaN."""
+    streams = {"air":("air_offset",["temp","pressure","humidity"]),
+               "imu":("imu_offset",["imu_cal","quat_w","quat_x","quat_y","quat_z"]),
+               "gps":("gps_offset",["latitude","longitude","altitude","num_sats","pDOP"])}
+    rtc_time = pd.to_datetime(df["rtc_time"]).to_numpy()
+    idxs = [np.flatnonzero(df[f"{k}_status"].to_numpy() == 1) for k in streams]
+    bounds = np.cumsum([0]+[len(i) for i in idxs])
+    
+    # one allocation per output column and each sensor fills its own rows
+    board_time = np.concatenate([rtc_time[i] + df[off].to_numpy()[i].astype(np.int64).astype("timedelta64[ms]") 
+                                 for i,(off,_) in zip(idxs,streams.values())])
+    order = np.argsort(board_time,kind="stable")
+    cols = {"rpi_time":pd.to_datetime(df["rpi_time"]).to_numpy()[np.concatenate(idxs)][order]}
+    for (start,stop),i,(_,labels) in zip(zip(bounds[:-1],bounds[1:]),idxs,streams.values()):
+        for k in labels:
+            cols[k] = np.full((bounds[-1],),np.nan)
+            cols[k][start:stop] = df[k].to_numpy()[i]
+    for (_,labels) in streams.values():
+        for k in labels: cols[k] = cols[k][order]
+    
+    return pd.DataFrame(cols,index=pd.Index(board_time[order],name="board_time"))
+
+def load_ancillary_log(fname:str,      # Path to log written by `AncillaryLog`
+                       start:int = 0,  # First record to read
+                       stop:int = None, # Stop before this record. Defaults to the end of the file
+                       clean:bool = False, # Split the sensor readings with `clean_ancillary`
+                      ) -> pd.DataFrame: # decoded packets with columns `packet_labels`, or sensor readings if `clean`
+    """Decode a range of records from an ancillary log. The RTC offset from `rtc_offset_ms` is stored in `df.attrs["offset_ms"]`."""
+    n_recs = os.path.getsize(fname)//log_dtype.itemsize
+    stop = n_recs if stop is None else min(stop,n_recs)
+    recs = np.fromfile(fname,dtype=log_dtype,count=max(stop-start,0),offset=start*log_dtype.itemsize)
+    df = pd.DataFrame(decode_packets(recs["packet"].tobytes(),rpi_time=recs["rpi_time"].view("datetime64[ns]"),aligned=True))
+    offset_ms = rtc_offset_ms(df) if len(df) > 0 else np.nan
+    if clean: df = clean_ancillary(df)
+    df.attrs["offset_ms"] = offset_ms
+    return df
+
+# %% ../nbs/api/sensors.ipynb 19
 class SensorStream():
     """Parses ancillary sensor data for saving"""
     def __init__(self, 
@@ -137,7 +387,6 @@ class SensorStream():
         
         self.ssd_dir  = ssd_dir
         self.cam_class = cam_class
-        self.packets = []
         
         self.toggle_interface = toggle_interface
         
@@ -148,54 +397,57 @@ class SensorStream():
                                     parity=serial.PARITY_NONE,
                                     stopbits=serial.STOPBITS_ONE)
             self.ser.flushInput()
+            self.reader = PacketReader(self.ser)
         except Exception as e:
             warnings.warn(f"{e}: could not open port {port}.",stacklevel=2)
         
-    def read_packet(self,header:chr = b"*", num_bytes:int = 76, timeout:float = 2.) -> "byte string":
-        """Reads at least `num_bytes` of a data packet starting with `header` 
-        and times out after `timeout` seconds if packet is invalid."""
-        buff = header
-
-        # Check for packet start of frame
-        start_time = time.time()
-        while True:
-            if self.ser.in_waiting > 0:
-                b = self.ser.read()
-                if b ==  header: break # packet received
-
-            if time.time() > start_time + timeout: 
-                print("No data packets.")
-                return None
-
-        # read the rest of data packet
-        start_time = time.time()
-        for i in range(num_bytes):
-            if time.time() > start_time + timeout:
-                print("Received Incomplete Packet")
-                break
-
-            if self.ser.in_waiting > 0:
-                buff += self.ser.read()
-
-        return buff
+    def read_packet(self, timeout:float = 2.) -> "byte string":
+        """Reads one data packet framed by `reader` and times out after `timeout` seconds if no valid packet arrives."""
+        pkt = self.reader.read_one(timeout)
+        if pkt is None: print("No data packets.")
+        return pkt
+    
+    def start_ingest(self, 
+                     max_packets:int = 2**16, # Number of packets to preallocate for. Grows if needed
+                    ):
+        """Start a thread that blocks on the serial port and stores framed packets in a preallocated array 
+        while `recording` is True."""
+        self.raw       = np.zeros((max_packets,self.reader.packet_len),dtype=np.uint8)
+        self.raw_times = np.zeros((max_packets,),dtype="datetime64[ns]") # system time each packet was framed
+        self.n_raw     = 0
+        self.recording = False
+        self.lock      = threading.Lock()
+        self.stop_event = threading.Event()
+        self.ser.timeout = 0.1 # so the thread can check `stop_event`
+        self.ingest_thread = threading.Thread(target=self._ingest, daemon=True)
+        self.ingest_thread.start()
+    
+    def _ingest(self):
+        while not self.stop_event.is_set():
+            self.reader.fill(block=True)
+            now = np.datetime64(time.time_ns(),"ns")
+            with self.lock:
+                for pkt in self.reader.packets():
+                    if not self.recording: continue # drain packets when not recording
+                    if self.n_raw == len(self.raw):
+                        self.raw       = np.concatenate((self.raw,np.zeros_like(self.raw)))
+                        self.raw_times = np.concatenate((self.raw_times,np.zeros_like(self.raw_times)))
+                    self.raw[self.n_raw] = np.frombuffer(pkt,dtype=np.uint8)
+                    self.raw_times[self.n_raw] = now
+                    self.n_raw += 1
+    
+    def stop_ingest(self):
+        """Stop the ingest thread."""
+        self.stop_event.set()
+        self.ingest_thread.join()
+    
+    def flush_log(self):
+        """Move the packets stored by the ingest thread to the ancillary log."""
+        with self.lock:
+            packets, times = self.raw[:self.n_raw].copy(), self.raw_times[:self.n_raw].copy()
+            self.n_raw = 0
+        if len(packets) > 0: self.log.append(packets,times)
     
-    def save(self):
-        """Save the data packets. Will save some plots of the data as well."""
-        self.directory = f"{self.ssd_dir}/{datetime.datetime.now(datetime.timezone.utc).strftime('%Y_%m_%d')}/"
-        Path(self.directory).mkdir(parents=False, exist_ok=True)
-        
-        df = pd.DataFrame(self.packets,columns=packet_labels)
-        self.new_df = self.clean_df(df)
-        
-        # find the time offset between the board and the system time (including the small delay between loops)
-        offset_ms = np.nanmin(df.rpi_time.to_numpy() - df.rtc_time.to_numpy() - np.timedelta64(1, "ms"))
-        
-        offset_ms /= np.timedelta64(1,"ms") # convert to ms
-        
-        fname = self.directory+f"{self.new_df.rpi_time[0].strftime('%Y_%m_%d-%H_%M_%S')}_ancillary_{offset_ms:.0f}.pkl"
-        with open(fname,"wb") as f:
-            pickle.dump(self.new_df,f,protocol=4)
-                    
     def master_loop(self,
                     n_lines:int        = 128,  # how many along-track pixels
                     processing_lvl:int = 0,    # desired processing done in real time
@@ -205,68 +457,56 @@ class SensorStream():
                     ssd_dir:str        = None, # path to SSD
                    ):
         """Continuous run saving packets during start button pressed. If you want to capture camera as well, 
-        input all the optional parameters."""
+        input all the optional parameters. Packets are read by an ingest thread and the loop sleeps until the toggle changes.
+        Packets are appended to an `AncillaryLog` during collection, see `load_ancillary_log` for the readings and RTC offset."""
         self.is_mounted = False
-        self.packets = []
+        self.start_ingest()
 
         while True:
-            if self.toggle_interface.status == True:
+            status = self.toggle_interface.wait_for_edge(timeout=1.)
+            if status == True:
 
                 if not self.is_mounted and self.ssd_dir: 
                     # os.system("mount /dev/sda1");
                     self.is_mounted = True
+                    self.directory = f"{self.ssd_dir}/{datetime.datetime.now(datetime.timezone.utc).strftime('%Y_%m_%d')}/"
+                    Path(self.directory).mkdir(parents=False, exist_ok=True)
+                    self.log = AncillaryLog(self.directory+f"{datetime.datetime.now(datetime.timezone.utc).strftime('%Y_%m_%d-%H_%M_%S')}_ancillary.bin")
+                    self.recording  = True
                     self.ser.write(b'y') # let sensor board know everything is set up
                     if self.cam_class:
                         from openhsi.cameras import switched_camera
                         self.p = Process(target=switched_camera, args=(self.cam_class, n_lines, processing_lvl, json_path,
                                                                            pkl_path, preconfig_meta, ssd_dir, self.toggle_interface))
                         self.p.start()
-
-                while self.ser.in_waiting > 0:
-                    self.packets.append( decode_packet(self.read_packet()) )
                 
-                time.sleep(0.001)
-
-            elif self.toggle_interface.status == False: # button off, stop collection and save packets to file
-
-                if self.ssd_dir and (len(self.packets)>0):
-                    if self.cam_class:
-                        self.ser.write(b'n') # let sensor board to stop sending packets
-                        self.save()
-                        #os.system("umount /dev/sda1"); self.is_mounted = False # keeps causing problems...
-                        self.is_mounted = False # not actually unmounted but lets you keep collecting with button pressses
-                        self.packets = []
-
-                time.sleep(0.001)
-
-    def clean_df(self, df:pd.DataFrame) -> pd.DataFrame:
-        """Converts time offsets in `df` into datetime and splits sensor readings that update 
-        at different rates. Also saves the plots as a picture."""
-        rtc_df = df[df.columns][(df["rtc_status"]==1)]
-        air_df = df[df.columns][(df["air_status"]==1)]
-        imu_df = df[df.columns][(df["imu_status"]==1)]
-        gps_df = df[df.columns][(df["gps_status"]==1)]
-
-        air_df.air_offset = air_df.rtc_time + pd.to_timedelta(air_df.air_offset, unit="ms")
-        imu_df.imu_offset = imu_df.rtc_time + pd.to_timedelta(imu_df.imu_offset, unit="ms")
-        gps_df.gps_offset = gps_df.rtc_time + pd.to_timedelta(gps_df.gps_offset, unit="ms")
-
-        air_df.rename({'air_offset': 'board_time'}, axis=1, inplace=True)
-        imu_df.rename({'imu_offset': 'board_time'}, axis=1, inplace=True)
-        gps_df.rename({'gps_offset': 'board_time'}, axis=1, inplace=True)
-
-        air_df.drop(["rtc_time","rtc_status","imu_status","air_status","gps_status","footer","imu_offset","gps_offset"],axis=1,inplace=True)
-        imu_df.drop(["rtc_time","rtc_status","imu_status","air_status","gps_status","footer","air_offset","gps_offset"],axis=1,inplace=True)
-        gps_df.drop(["rtc_time","rtc_status","imu_status","air_status","gps_status","footer","air_offset","imu_offset"],axis=1,inplace=True)
-
-        air_df[["imu_cal","quat_w","quat_x","quat_y","quat_z","latitude","longitude","altitude","num_sats","pDOP"]] = np.nan
-        imu_df[["temp","pressure","humidity","latitude","longitude","altitude","num_sats","pDOP"]] = np.nan
-        gps_df[["temp","pressure","humidity","imu_cal","quat_w","quat_x","quat_y","quat_z"]] = np.nan
-
-        new_df = pd.concat([air_df,imu_df,gps_df])
-        new_df.set_index("board_time",inplace=True)
-        new_df.sort_index(inplace=True)
+                if self.recording: self.flush_log() # write to disk about once a second
 
+            elif status == False: # button off, stop collection and close the log
+                
+                if self.recording:
+                    self.recording = False
+                    self.ser.write(b'n') # let sensor board to stop sending packets
+                    self.flush_log()
+                    self.log.close()
+                    #os.system("umount /dev/sda1"); self.is_mounted = False # keeps causing problems...
+                    self.is_mounted = False # not actually unmounted but lets you keep collecting with button pressses
+
+    def clean_df(self, 
+                 df:pd.DataFrame,   # Decoded packets with columns `packet_labels`
+                 plot:bool = False, # Also save plots of the sensor streams, see `plot_df`
+                ) -> pd.DataFrame: # sensor readings indexed by board time
+        """Split the sensor readings with `clean_ancillary`."""
+        new_df = clean_ancillary(df)
+        if plot: self.plot_df(new_df)
+        return new_df
+    
+    def plot_df(self, new_df:pd.DataFrame): 
+        """Plot the sensor streams from `clean_df` and save the picture."""
+        gps_df = new_df[~np.isnan(new_df.latitude.to_numpy())]
+        imu_df = new_df[~np.isnan(new_df.quat_w.to_numpy())]
+        air_df = new_df[~np.isnan(new_df.temp.to_numpy())]
+        
         fig, axes = plt.subplots(nrows=2, ncols=3,figsize=(16,12))
         gps_df.plot(ax=axes[0,0],x="longitude",y="latitude",ylabel="latitude",label="path")
         gps_df.plot(ax=axes[0,1],x="rpi_time",y="num_sats")
@@ -276,20 +516,21 @@ class SensorStream():
         air_df.plot(ax=axes[1,2],x="rpi_time",y="humidity")
         
         fig.savefig(self.directory+f"{new_df.rpi_time[0].strftime('%Y_%m_%d-%H_%M_%S')}_ancillary.png",bbox_inches='tight',transparent=False, pad_inches=0)
-        return new_df
     
 
-# %% ../nbs/api/sensors.ipynb 14
+# %% ../nbs/api/sensors.ipynb 22
 def set_pps_cb(
     gps_pin:int=19, # GPS pulse per second pin
     times_list:List[datetime.datetime]=[], # Any list to append system time when callback is called
     bouncetime_ms:float=10, # Debouncing time for the GPS PPS signal
+    monotonic:bool=False, # Append `time.monotonic_ns()` instead so the edges can be used by `ClockModel.from_pps`
 ):
     """Setup a callback that appends the system time to `times_list` each time 
     a GPS pulse per second is detected on `gps_pin`."""
     GPIO.setup(gps_pin,GPIO.IN,pull_up_down=GPIO.PUD_DOWN)
     def pps_cb(channel):
-        times_list.append(datetime.datetime.now()-datetime.timedelta(milliseconds=bouncetime_ms))
+        if monotonic: times_list.append(time.monotonic_ns())
+        else: times_list.append(datetime.datetime.now()-datetime.timedelta(milliseconds=bouncetime_ms))
     GPIO.add_event_detect(gps_pin,GPIO.RISING,callback=pps_cb,bouncetime=bouncetime_ms)
 
 def clear_pps_cb(
@@ -298,7 +539,7 @@ def clear_pps_cb(
     """Clear the GPS pulse per second callback on `gps_pin`."""
     GPIO.remove_event_detect(gps_pin)
 
-# %% ../nbs/api/sensors.ipynb 16
+# %% ../nbs/api/sensors.ipynb 26
 def collect_sim(rtc_offset_ms:float=0) -> list:
     """Generate fake sensor packets for testing."""
     
@@ -338,22 +579,71 @@ def collect_sim(rtc_offset_ms:float=0) -> list:
     
     return contents
 
-# %% ../nbs/api/sensors.ipynb 24
-def interp2camera_times(df:pd.DataFrame, ts:np.array) -> pd.DataFrame:
+# %% ../nbs/api/sensors.ipynb 34
+def slerp(t:np.ndarray,     # Times of the quaternions, sorted
+          quats:np.ndarray, # Unit quaternions with shape (N,4)
+          t_new:np.ndarray, # Times to interpolate to
+         ) -> np.ndarray: # interpolated unit quaternions with shape (len(t_new),4)
+    """Vectorised spherical linear interpolation of quaternions. Times outside `t` are clamped."""
+    if len(t) == 1: return np.repeat(quats,len(t_new),axis=0)
+    idx = np.clip(np.searchsorted(t,t_new,side="right")-1,0,len(t)-2)
+    dt  = t[idx+1] - t[idx]
+    u   = np.clip((t_new - t[idx])/np.where(dt > 0,dt,1),0,1)[:,None]
+    q0, q1 = quats[idx], quats[idx+1]
+    dot = np.sum(q0*q1,axis=1,keepdims=True)
+    q1  = np.where(dot < 0,-q1,q1) # take the shorter path
+    dot = np.clip(np.abs(dot),0,1)
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    small = sin_theta < 1e-6 # nearly parallel so lerp is fine
+    w0 = np.where(small,1-u,np.sin((1-u)*theta)/np.where(small,1,sin_theta))
+    w1 = np.where(small,u,np.sin(u*theta)/np.where(small,1,sin_theta))
+    q = w0*q0 + w1*q1
+    return q/np.linalg.norm(q,axis=1,keepdims=True)
+
+def interp2camera_times(df:pd.DataFrame, # Sensor readings indexed by board time, see `clean_ancillary`
+                        ts:np.array,     # Camera frame timestamps
+                        method:str = "cubic", # Interpolation for each channel. Can be 'linear' or 'cubic'
+                       ) -> pd.DataFrame:
     """Interpolate the ancillary sensor data to the timestamps for when 
-    each frame was taken with the camera."""
-    df_add = pd.DataFrame({"cam_now":ts,"type":"camera"}).set_index("cam_now",inplace=False)
-    df.insert(0,"type","sensors")
-    df_with_cam = pd.concat([df,df_add]).sort_index()
+    each frame was taken with the camera. Each column is interpolated from its own (non NaN) readings 
+    and the `quat_*` columns are interpolated with SLERP. Timestamps outside the readings are clamped."""
+    t0 = df.index.to_numpy().astype("datetime64[ns]").astype(np.int64)
+    ref = t0.min() if len(t0) else 0
+    t   = (t0 - ref)/1e9 # seconds
+    t_new = (pd.to_datetime(np.asarray(ts)).to_numpy().astype("datetime64[ns]").astype(np.int64) - ref)/1e9
+    order = np.argsort(t,kind="stable")
+    t = t[order]
     
-    df_with_cam.interpolate(method="cubicspline",axis="index",limit_direction="both",inplace=True)
-    df_with_cam = df_with_cam[df_with_cam.type.str.match("camera")]
-    df_with_cam.drop(labels="type", axis=1,inplace=True)
-
-    return df_with_cam
+    def readings(col:np.ndarray) -> Tuple[np.ndarray,np.ndarray]:
+        ok = ~np.isnan(col)
+        tt, first = np.unique(t[ok],return_index=True) # spline needs strictly increasing times
+        return tt, col[ok][first]
+    
+    out = {}
+    quat_cols = [c for c in ["quat_w","quat_x","quat_y","quat_z"] if c in df.columns]
+    for c in df.columns:
+        if c in quat_cols: continue
+        col = df[c].to_numpy()[order]
+        is_time = np.issubdtype(col.dtype,np.datetime64)
+        col = (col.astype("datetime64[ns]").astype(np.int64) - ref).astype(np.float64) if is_time else col.astype(np.float64)
+        tt, yy = readings(col)
+        if len(tt) == 0: vals = np.full(t_new.shape,np.nan)
+        elif method == "cubic" and len(tt) >= 4 and not is_time:
+            vals = CubicSpline(tt,yy)(np.clip(t_new,tt[0],tt[-1]))
+        else: vals = np.interp(t_new,tt,yy)
+        out[c] = (np.round(vals).astype(np.int64) + ref).astype("datetime64[ns]") if is_time and len(tt) else vals
+    
+    if len(quat_cols) == 4:
+        quats = df[quat_cols].to_numpy(dtype=np.float64)[order]
+        ok = ~np.isnan(quats).any(axis=1)
+        tt, first = np.unique(t[ok],return_index=True)
+        q = slerp(tt,quats[ok][first],t_new) if len(tt) else np.full((len(t_new),4),np.nan)
+        for k,c in enumerate(quat_cols): out[c] = q[:,k]
     
+    return pd.DataFrame({c:out[c] for c in df.columns},index=pd.Index(ts,name="cam_now"))
 
-# %% ../nbs/api/sensors.ipynb 26
+# %% ../nbs/api/sensors.ipynb 37
 #| output: false
 import param
 import panel as pn
@@ -367,20 +657,48 @@ from streamz.dataframe import PeriodicDataFrame
 hv.extension('bokeh',logo=False)
 from holoviews.streams import Pipe, Buffer
 
-# %% ../nbs/api/sensors.ipynb 27
+# %% ../nbs/api/sensors.ipynb 38
+dashboard_labels = ["lat","lon","sats","temp","pressure","humidity","sys_cal","gyro_cal","accel_cal","mag_cal"]
+
+dashboard_dtype = np.dtype({"names":  ["lat","lon","temp","pressure","humidity","sats","rpi_ready","cal"],
+                            "formats":["<i4","<i4","<f4","<f4","<f4","u1","u1","u1"],
+                            "offsets":[0,4,8,12,16,20,21,22],
+                            "itemsize":23})
+
+def decode_dashboard_lines(lines:List[bytes], # XBee lines from the sensor board
+                          ) -> np.ndarray: # readings with columns `dashboard_labels`
+    """Decode XBee lines all at once."""
+    recs = np.frombuffer(b"".join(l[:dashboard_dtype.itemsize] for l in lines),dtype=dashboard_dtype)
+    out = np.empty((len(recs),len(dashboard_labels)),dtype=np.float64)
+    out[:,0] = recs["lat"]*1e-7 # latitude [deg]
+    out[:,1] = recs["lon"]*1e-7 # longitude [deg]
+    out[:,2] = recs["sats"]     # number of satellites in view and used in compute
+    out[:,3] = recs["temp"]     # temperature [deg C]
+    out[:,4] = recs["pressure"] # pressure [hPa]
+    out[:,5] = recs["humidity"] # humidity [relative humidity %]
+    out[:,6] = (recs["cal"] & 0b1100_0000) >> 6 # system calibration
+    out[:,7] = (recs["cal"] & 0b0011_0000) >> 4 # gyro calibration
+    out[:,8] = (recs["cal"] & 0b0000_1100) >> 2 # accel calibration
+    out[:,9] =  recs["cal"] & 0b0000_0011       # mag calibration
+    return out
+
 class SensorDashboard():
     """A dashboard for viewing ancillary sensor status."""
-    def __init__(self, baudrate=115_200, port="/dev/cu.usbserial-DN05TVTD",buff_len:int = 100):
+    def __init__(self, baudrate=115_200, port="/dev/cu.usbserial-DN05TVTD",buff_len:int = 100,
+                 ring_len:int = 2**14, # Number of readings kept in memory
+                ):
         """Create a dashboard to view ancillary sensor diagnostics."""
         self.ser = serial.Serial(port=port,
                                 baudrate=baudrate,
                                 bytesize=serial.EIGHTBITS,
                                 parity=serial.PARITY_NONE,
                                 stopbits=serial.STOPBITS_ONE,)
+        self.reader = PacketReader(self.ser, header=None, packet_len=23)
         
         # Instantiate for storing data
-        self.data = []
-        self.data_df = pd.DataFrame(None, columns=["lat","lon","sats","temp","pressure","humidity","sys_cal","gyro_cal","accel_cal","mag_cal"])
+        self.ring = CircArrayBuffer(size=(ring_len,len(dashboard_labels)),axis=0,dtype=np.float64)
+        self.n_read = 0 # total readings, used as the index of the streams
+        self.new_df = pd.DataFrame(None, columns=dashboard_labels)
         
         self.loc_stream = Buffer( pd.DataFrame({"lon":[],"lat":[]}), length=buff_len, index=False)
         #temp = pd.DataFrame({"lon":[151.1,151.2],"lat":[-33.8,-34]})
@@ -453,56 +771,34 @@ class SensorDashboard():
         self.msg.value = f"Cleared {self.clear_btn.clicks} time(s)"
         
         
+    @property
+    def data_df(self) -> pd.DataFrame:
+        """Readings kept in the ring buffer, oldest first."""
+        n = min(self.n_read,self.ring.size[0])
+        idx = (np.arange(-n,0) + self.ring.write_pos[0]) % self.ring.size[0]
+        return pd.DataFrame(self.ring.data[idx],columns=dashboard_labels,index=np.arange(self.n_read-n,self.n_read))
+    
     def update(self):
         """Push new sensor data to streams"""
-        self.loc_stream.send( pd.concat(lnglat_to_meters(self.data_df['lon'], self.data_df['lat']),axis=1))
-        self.sat_stream.send( self.data_df["sats"].to_frame() )
-        self.temp_stream.send( self.data_df["temp"].to_frame() )
-        self.pressure_stream.send( self.data_df["pressure"].to_frame() )
-        self.humidity_stream.send( self.data_df["humidity"].to_frame() )
-        self.sys_stream.send( self.data_df["sys_cal"].to_frame() )
-        self.gyro_stream.send( self.data_df["gyro_cal"].to_frame() )
-        self.accel_stream.send( self.data_df["accel_cal"].to_frame() )
-        self.mag_stream.send( self.data_df["mag_cal"].to_frame() )
+        if len(self.new_df) == 0: return
+        self.loc_stream.send( pd.concat(lnglat_to_meters(self.new_df['lon'], self.new_df['lat']),axis=1))
+        self.sat_stream.send( self.new_df["sats"].to_frame() )
+        self.temp_stream.send( self.new_df["temp"].to_frame() )
+        self.pressure_stream.send( self.new_df["pressure"].to_frame() )
+        self.humidity_stream.send( self.new_df["humidity"].to_frame() )
+        self.sys_stream.send( self.new_df["sys_cal"].to_frame() )
+        self.gyro_stream.send( self.new_df["gyro_cal"].to_frame() )
+        self.accel_stream.send( self.new_df["accel_cal"].to_frame() )
+        self.mag_stream.send( self.new_df["mag_cal"].to_frame() )
         
-    def read(self,timeout:float=2):
-        """Parse XBee data packets and timeout if none received."""
-        start_time = time.time()
-
-        # Check if line is ready
-        while self.ser.inWaiting() > 0:
-            
-            # Read line from serial
-            self.line_data = self.ser.readline()
-            if len(self.line_data) < 22: continue # packet not complete, skip
-            
-            if time.time()-start_time > timeout:
-                print("timeout")
-                self.ser.flushInput()
-                break
-            
-            contents = []
-            np_buff = np.frombuffer(self.line_data,dtype='int8').astype(np.uint8) 
-            
-            contents.append( float(np_buff[0:4].view(np.int32))*1e-7 ) # latitude [deg]
-            contents.append( float(np_buff[4:8].view(np.int32))*1e-7 ) # longitude [deg]
-            contents.append( np_buff[20].view(np.uint8)    ) # number of satellites in view and used in compute
-            
-            # remove before export
-            #contents[0] += 2*np.random.rand() - 1; contents[1] += 2*np.random.rand() - 1 # obfuscate my position
-            
-            contents.append( np_buff[ 8:12].view(np.float32)[0] ) # temperature [deg C]
-            contents.append( np_buff[12:16].view(np.float32)[0] ) # pressure [hPa]
-            contents.append( np_buff[16:20].view(np.float32)[0] ) # humidity [relative humidity %]
-            
-            self.rpi_ready = True if np_buff[21].view(np.uint8) > 0 else False
-            
-            cal_char = np_buff[22].view(np.uint8)
-            contents.append( (cal_char & 0b1100_0000) >> 6) # system calibration
-            contents.append( (cal_char & 0b0011_0000) >> 4) # gyro calibration
-            contents.append( (cal_char & 0b0000_1100) >> 2) # accel calibration
-            contents.append(  cal_char & 0b0000_0011      ) # mag calibration
-            self.data.append(contents)
-        self.data_df = pd.DataFrame(self.data, columns=["lat","lon","sats","temp","pressure","humidity","sys_cal","gyro_cal","accel_cal","mag_cal"])
+    def read(self,timeout:float=0):
+        """Parse the XBee data packets waiting on the serial port. Set `timeout` to wait for at least one. 
+        Only the new readings are kept in `new_df`."""
+        lines = self.reader.read(timeout)
+        contents = decode_dashboard_lines(lines)
+        if len(lines) > 0: self.rpi_ready = lines[-1][21] > 0
+        self.ring.put_block(contents)
+        self.new_df = pd.DataFrame(contents,columns=dashboard_labels,index=np.arange(self.n_read,self.n_read+len(contents)))
+        self.n_read += len(contents)
         
     
@@ -14,9 +14,10 @@ from typing import Iterable, Union, Callable, List, TypeVar, Generic, Tuple, Opt
 from functools import reduce
 from pathlib import Path
 import xarray as xr
+import time
 
 # %% ../nbs/api/shared.ipynb 5
-from .data import CameraProperties, CircArrayBuffer, DateTimeBuffer
+from .data import CameraProperties, CircArrayBuffer, DateTimeBuffer, QuickLook
 
 from ctypes import c_int32, c_uint32, c_float, c_uint16, c_uint8
 from multiprocessing import Process, Queue, Array
@@ -38,6 +39,7 @@ class SharedCircArrayBuffer(CircArrayBuffer):
         self.read_pos  = self.write_pos.copy()
         self.slots_left = self.size[self.axis]
         self.show_func = show_func
+        self.n_puts = 0
 
 # %% ../nbs/api/shared.ipynb 7
 @delegates()
@@ -60,6 +62,7 @@ class SharedDataCube(CameraProperties):
         
         # Only one set of buffers can be used at a time
         self.timestamps_swaps = [DateTimeBuffer(n_lines), DateTimeBuffer(n_lines)]
+        self.clock_model = None # `ClockModel` used to discipline the timestamps when saving
         self.dc_swaps         = [SharedCircArrayBuffer(size=self.dc_shape, axis=1, c_dtype=self.dtype_out),
                                  SharedCircArrayBuffer(size=self.dc_shape, axis=1, c_dtype=self.dtype_out)]
         print(f"Allocated {2*4*reduce(lambda x,y: x*y, self.dc_shape)/2**20:.02f} MB of RAM.")
@@ -71,9 +74,12 @@ class SharedDataCube(CameraProperties):
     def __repr__(self):
         return f"DataCube: shape = {self.dc_shape}, Processing level = {self.proc_lvl}\n"
 
-    def put(self, x:np.ndarray):
+    def put(self, 
+            x:np.ndarray,       # Image from the camera
+            mono_ns:int = None, # Monotonic clock reading when `x` was acquired. Defaults to now
+           ):
         """Applies the composed tranforms and writes the 2D array into the data cube. Stores a timestamp for each push."""
-        self.timestamps.update()
+        self.timestamps.update(mono_ns)
         self.dc.put( self.pipeline(x) )
  
 
@@ -86,6 +92,7 @@ def save(self:SharedDataCube, save_dir:str, preconfig_meta_path:str=None, prefix
         with open(preconfig_meta_path) as json_file:
             attrs = json.load(json_file)
     else: attrs = {}
+    if self.clock_model is not None: self.timestamps.discipline(self.clock_model)
     
     self.directory = Path(f"{save_dir}/{self.timestamps[0].strftime('%Y_%m_%d')}/").mkdir(parents=True, exist_ok=True)
     self.directory = f"{save_dir}/{self.timestamps[0].strftime('%Y_%m_%d')}"
@@ -96,13 +103,13 @@ def save(self:SharedDataCube, save_dir:str, preconfig_meta_path:str=None, prefix
         self.coords = dict(wavelength=(["wavelength"],wavelengths),
                            x=(["x"],np.arange(self.dc.data.shape[0])),
                            y=(["y"],np.arange(self.dc.data.shape[1])),
-                           time=(["time"],self.timestamps.data.astype(np.datetime64)),
+                           time=(["time"],self.timestamps.data),
                            temperature=(["temperature"],self.cam_temperatures.data))
     else:
         self.coords = dict(wavelength=(["wavelength"],wavelengths),
                            x=(["x"],np.arange(self.dc.data.shape[0])),
                            y=(["y"],np.arange(self.dc.data.shape[1])),
-                           time=(["time"],self.timestamps.data.astype(np.datetime64)))
+                           time=(["time"],self.timestamps.data))
         
     fname = f"{self.directory}/{prefix}{self.timestamps[0].strftime('%Y_%m_%d-%H_%M_%S')}{suffix}"
     
@@ -134,32 +141,9 @@ def show(self:SharedDataCube,
     Further customise your plot with `**plot_kwargs`. `quick_imshow` is used for saving figures quickly
     but cannot be used to make interactive plots. """
 
-    rgb = np.zeros( (*self.dc.data.shape[:2],3), dtype=np.float32)
-    if hasattr(self, "binned_wavelengths"):
-        rgb[...,0] = self.dc.data[:,:,np.argmin(np.abs(self.binned_wavelengths-red_nm))]
-        rgb[...,1] = self.dc.data[:,:,np.argmin(np.abs(self.binned_wavelengths-green_nm))]
-        rgb[...,2] = self.dc.data[:,:,np.argmin(np.abs(self.binned_wavelengths-blue_nm))]
-    else:
-        rgb[...,0] = self.dc.data[:,:,int(self.dc.data.shape[2] / 2)]
-        rgb[...,1] = self.dc.data[:,:,int(self.dc.data.shape[2] / 2)]
-        rgb[...,2] = self.dc.data[:,:,int(self.dc.data.shape[2] / 2)]
-
-    if robust and not hist_eq: # scale everything to the 2% and 98% percentile
-        vmax = np.nanpercentile(rgb, 98)
-        vmin = np.nanpercentile(rgb, 2)
-        rgb = ((rgb.astype("f8") - vmin) / (vmax - vmin)).astype("f4")
-        rgb = np.minimum(np.maximum(rgb, 0), 1)
-    elif hist_eq and not robust:
-        img_hist, bins = np.histogram(rgb.flatten(), 256, density=True)
-        cdf = img_hist.cumsum() # cumulative distribution function
-        cdf = 1. * cdf / cdf[-1] # normalize
-        img_eq = np.interp(rgb.flatten(), bins[:-1], cdf) # find new pixel values from linear interpolation of cdf
-        rgb = img_eq.reshape(rgb.shape)
-    elif robust and hist_eq:
-        warnings.warn("Cannot mix robust with histogram equalisation. No RGB adjustments will be made.",stacklevel=2)
-        rgb /= np.max(rgb)
-    else:
-        rgb /= np.max(rgb)
+    if not hasattr(self, "quicklook"): self.quicklook = QuickLook()
+    self.quicklook.set_wavelengths(getattr(self, "binned_wavelengths", None))
+    rgb = self.quicklook(self.dc.data, red_nm, green_nm, blue_nm, robust, hist_eq).copy() # the buffer is reused by the next render
 
     if quick_imshow:
         fig, ax = plt.subplots(figsize=(12,3))
@@ -238,15 +222,7 @@ def save_shared_datacube(fname:str,          # NetCDF4 file name (without .nc)
     
     if savefig:
         # quick save the histogram equalised RGB
-        rgb = np.zeros( (*shape[:2],3), dtype=np.float32)
-        rgb[...,0] = data[:,:,np.argmin(np.abs(coords_dict["wavelength"][1]-640.))]
-        rgb[...,1] = data[:,:,np.argmin(np.abs(coords_dict["wavelength"][1]-550.))]
-        rgb[...,2] = data[:,:,np.argmin(np.abs(coords_dict["wavelength"][1]-470.))]
-        img_hist, bins = np.histogram(rgb.flatten(), 256, density=True)
-        cdf = img_hist.cumsum() # cumulative distribution function
-        cdf = 1. * cdf / cdf[-1] # normalize
-        img_eq = np.interp(rgb.flatten(), bins[:-1], cdf) # find new pixel values from linear interpolation of cdf
-        rgb = img_eq.reshape(rgb.shape)
+        rgb = QuickLook(coords_dict["wavelength"][1])(data, hist_eq=True)
         fig, ax = plt.subplots(figsize=(12,3))
         ax.imshow(rgb,aspect="equal"); ax.set_xlabel("along-track"); ax.set_ylabel("cross-track")
         fig.savefig(fname+".png",bbox_inches='tight', pad_inches=0)
@@ -277,7 +253,8 @@ class SharedOpenHSI(SharedDataCube):
         """Collect the hyperspectral datacube."""
         #self.start_cam()
         for i in tqdm(range(self.n_lines)):
-            self.put(self.get_img())
+            mono_ns = time.monotonic_ns() # the frame is exposed and read out while `get_img` waits for it
+            self.put(self.get_img(), mono_ns=mono_ns)
             
             if callable(getattr(self,"get_temp",None)):
                 self.cam_temperatures.put( self.get_temp() )